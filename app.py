@@ -1,9 +1,22 @@
 from home_components import section_header
-from memedo.ai_agents.meme_agent import generate_meme_content
-from memedo.ai_agents.summary_agent import get_match_summary
-from memedo.models.meme_template import all_memes
+from memedo.ai_agents.meme_agent import generate_meme_content, prepare_catalogue
+from memedo.ai_agents.summary_agent import get_match_summary_cached
+from memedo.controllers.job_queue import Job_Queue, Queue_Full
+from memedo.controllers.events import generation_events
+from memedo.controllers.static_files import static_file_response, static_stats
+from memedo.controllers.meme_generator import render_memes_as_completed, template_cache_stats, warm_render_pool
+from memedo.utils.database import Write_Batch_Database
+from memedo.utils.fragment_cache import card_cache
+from memedo.utils.output_store import output_store
+from memedo.utils.tracing import tracer
+from memedo.models.template_registry import template_registry
+from memedo import config
 from loguru import logger
+import asyncio
 import json
+import secrets
+import threading
+import time
 from fasthtml.common import *
 import os, uvicorn
 from PIL import Image
@@ -19,127 +32,427 @@ logger.add(sys.stdout, format="{time} {level} {message}", level="INFO")
 logger.info("Logging is set up.")
 
 
-# Function to extract meme information
-def get_meme_info(meme_class):
-    meme_instance = meme_class()
-    return {
-        'id': meme_class.id,
-        'name': meme_class.name,
-        'description': meme_class.description,
-        'instruction': meme_instance.instruction.strip(),
-    }
+# What /ready reports: each step of the warm-up that runs once the server is up, and the time it took
+readiness = {'db': False, 'catalogue': False, 'render_pool': False}
+started_at = time.monotonic()
 
 
-# Collect meme information
-memes_info = [get_meme_info(meme["class"]) for meme in all_memes]
+# Build the meme catalogue and start the render workers, off the startup path. Fonts and templates are only
+# used in the workers, which load them as they start (see meme_generator._init_worker), so this process doesn't.
+# Requests that arrive first still work; they just pay for whatever isn't warm yet
+def warm_up():
+    try:
+        prepare_catalogue(template_registry.catalogue())
+        readiness['catalogue'] = True
+        warm_render_pool()
+        readiness['render_pool'] = True
+        logger.info(f"Warmed up {time.monotonic() - started_at:.2f}s after start")
+    except Exception:
+        logger.exception("Warm-up failed; the app stays unready")
 
 
-#
-# @app.post("/generate-images/")
-# async \
-def generate_images(prompt: str) -> List[str]:
+def start_warm_up():
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+# Summarize the match, pick memes and render them, yielding each meme's render result (see
+# render_meme_with_stats) as soon as it is done, with the image path added for successful ones
+def generate_images_iter(prompt: str):
     logger.info(f"Generating images for prompt: {prompt}")
-    match_summary = get_match_summary(prompt)
+    with tracer.span("summary"):
+        match_summary = get_match_summary_cached(prompt)
     logger.info(f"Match summary: {match_summary}")
-    generated_memes = generate_meme_content(match_summary, memes_info, 5)['memes']
+    with tracer.span("selection"):
+        generated_memes = generate_meme_content(match_summary, template_registry.catalogue(), 5)['memes']
     logger.info(f"Generated memes: {generated_memes}")
-    created_memes = []
-    for meme_out in generated_memes:
-        # instantiate the meme by taking approporiate class from al lmemes using id
-        meme_class = next(meme["class"] for meme in all_memes if meme["id"] == meme_out["id"])
-        meme_instance = meme_class()
-        print(meme_out)
-        created_memes.append(meme_instance.create(json.loads(meme_out["meme_creation_input"])))
+    for result in render_memes_as_completed(generated_memes):
+        if result["status"] == "ok":
+            result["path"] = f"{BASE_IMAGE_PATH}{result['file_name']}"
+        yield result
 
-    generated_images = [f"{BASE_IMAGE_PATH}{x}" for x in created_memes]
-    return generated_images
 
+# gens database for storing generated image details
+# Reads use a connection per thread; writes from request handlers and workers go through one batching writer
+db = Write_Batch_Database(config.GENS_DB_PATH, busy_timeout_ms=config.DB_BUSY_TIMEOUT_MS,
+                          synchronous=config.DB_SYNCHRONOUS, batch_size=config.DB_WRITE_BATCH_SIZE,
+                          batch_wait=config.DB_WRITE_BATCH_WAIT)
+gens = db.table('gens')
+# One row per rendered (or failed) meme of a generation. This replaces gens.paths, which is no longer written
+gen_images = db.table('generated_images')
 
-# print(generate_images("india new zealand test match 17 october 2024"))
 
-# gens database for storing generated image details
-tables = database('data/gens.db').t
-gens = tables.gens
-if not gens in tables:
-    gens.create(prompt=str, id=int, paths=list, pk='id')
-Generation = gens.dataclass()
+def image_stats(path):
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+        return dict(width=width, height=height, bytes=os.path.getsize(path), status='ok')
+    except OSError:
+        return dict(status='missing')
+
+
+# Move the paths of existing generations into generated_images, in batched transactions
+def backfill_generated_images(batch_size=500):
+    def rows():
+        for g in gens(where="paths != '[]'", order_by="id"):
+            for path in json.loads(g.paths):
+                yield dict(generation_id=g.id, path=path, created_at=g.created_at, **image_stats(path))
+    gen_images.insert_all(rows(), batch_size=batch_size)
+    logger.info(f"Backfilled {gen_images.count} generated images")
+
+
+# Create or migrate the tables. Runs at server startup rather than import, so importing the app stays cheap
+def setup_gens_db():
+    global Generation, GeneratedImage
+    tables = db.t
+    if not gens in tables:
+        gens.create(prompt=str, id=int, paths=list, done=bool, created_at=float, pk='id')
+    else:
+        if 'done' not in gens.columns_dict:
+            # Paths now fill in one by one, so "has paths" no longer means finished
+            gens.add_column('done', int)
+            db.execute("UPDATE gens SET done = 1 WHERE paths != '[]'")
+        if 'created_at' not in gens.columns_dict:
+            # Older rows have no timestamp; 0 keeps them behind new ones, in id order
+            gens.add_column('created_at', float)
+            db.execute("UPDATE gens SET created_at = 0")
+    # The gallery pages on (created_at, id), newest first
+    gens.create_index(['created_at', 'id'], index_name='gens_created_at', if_not_exists=True)
+    Generation = gens.dataclass()
+
+    if not gen_images in tables:
+        gen_images.create(id=int, generation_id=int, template_id=int, path=str, width=int, height=int, bytes=int,
+                          render_ms=float, status=str, created_at=float, pk='id')
+        gen_images.create_index(['generation_id'], index_name='generated_images_generation', if_not_exists=True)
+        gen_images.create_index(['template_id'], index_name='generated_images_template', if_not_exists=True)
+        backfill_generated_images()
+    GeneratedImage = gen_images.dataclass()
+    readiness['db'] = True
+
+
+# The output store deletes the least recently used renders once it is full. Mark their rows evicted, so the
+# gallery stops showing them, and drop the cached cards of the generations they belonged to
+def mark_evicted(paths: List[str]):
+    placeholders = ", ".join("?" * len(paths))
+    ids = [row[0] for row in db.execute(
+        f"SELECT DISTINCT generation_id FROM generated_images WHERE status = 'ok' AND path IN ({placeholders})", paths)]
+    db.write(f"UPDATE generated_images SET status = 'evicted' WHERE status = 'ok' AND path IN ({placeholders})",
+             paths).result()
+    for id in ids:
+        card_cache.discard(id)
+    logger.info(f"Evicted {len(paths)} renders, from {len(ids)} generations")
+
+
+output_store.on_evict = mark_evicted
+
+
+# Paths of a generation's rendered images, in the order they finished
+def generation_image_paths(id: int) -> List[str]:
+    return [row[0] for row in db.execute(
+        "SELECT path FROM generated_images WHERE generation_id = ? AND status = 'ok' ORDER BY id", [id])]
+
+
+class Bad_Cursor(ValueError):
+    pass
+
+
+# (created_at, id) from a gallery cursor, "<created_at>:<id>"; raises Bad_Cursor if it isn't one
+def parse_cursor(before: str):
+    try:
+        created_at, id = before.split(':')
+        return float(created_at), int(id)
+    except ValueError:
+        raise Bad_Cursor(before) from None
+
+
+# One page of the gallery, newest first, and the cursor for the next page (None on the last one).
+# `before` is the cursor of the previous page: "<created_at>:<id>" of its last generation
+def gallery_page(before: str = None, limit: int = None):
+    limit = limit or config.GALLERY_PAGE_SIZE
+    where, where_args = None, None
+    if before:
+        where, where_args = "(created_at, id) < (?, ?)", list(parse_cursor(before))
+    rows = gens(where=where, where_args=where_args, order_by="created_at DESC, id DESC", limit=limit + 1,
+                select="id, prompt, done, created_at")
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, f"{rows[-1].created_at!r}:{rows[-1].id}"
 
 # Flexbox CSS (http://flexboxgrid.com/)
 gridlink = Link(rel="stylesheet", href="https://cdnjs.cloudflare.com/ajax/libs/flexboxgrid/6.3.1/flexboxgrid.min.css", type="text/css")
 app_css = Link(rel="stylesheet", href="app.css", type="text/css")
+# htmx SSE extension, for pushing generation previews
+sse_ext = Script(src="https://unpkg.com/htmx-ext-sse@2.2.2/sse.js")
+# Let htmx swap in the "too busy" card we send back with a 429
+busy_swap = Script("""
+document.addEventListener("htmx:beforeSwap", (e) => {
+    if (e.detail.xhr.status === 429) { e.detail.shouldSwap = true; e.detail.isError = false; }
+});
+""")
+
+
+# Queue a generated_images row for one render result (see render_meme_with_stats); the future resolves once committed.
+# The "save" span runs until then
+def save_image_result(id: int, result: dict):
+    span = tracer.span("save", template=result["template_id"])
+    saved = db.insert('generated_images', GeneratedImage(
+        generation_id=id, template_id=result["template_id"], path=result.get("path"),
+        width=result.get("width"), height=result.get("height"), bytes=result.get("bytes"),
+        render_ms=result.get("render_ms"), status=result["status"], created_at=time.time()))
+    saved.add_done_callback(lambda future: span.end("ok" if future.exception() is None else "error"))
+    return saved
+
+
+# Generate images and save them as they come in (on a generation queue worker)
+def generate_and_save(id: int, prompt: str):
+    # paths = ['memedo/out/creations/20241018011430141900.jpg', 'memedo/out/creations/20241018011430169624.jpg',
+    #          'memedo/out/creations/20241018011430313254.jpg', 'memedo/out/creations/20241018011430329335.jpg',
+    #          'memedo/out/creations/20241018011430421782.jpg']
+    # Everything still queued just moved up a place
+    for queued_id in [id] + generation_queue.queued():
+        generation_events.publish(queued_id)
+    # A generation cut off by a shutdown runs again from scratch: drop the rows it saved last time.
+    # The render files stay, other generations may share them
+    db.write("DELETE FROM generated_images WHERE generation_id = ?", [id])
+    paths = []
+    with tracer.generation(id):
+        try:
+            for result in generate_images_iter(prompt):
+                saved = save_image_result(id, result)
+                if result["status"] == "ok":
+                    paths.append(result["path"])
+                    # Tell the previews once the row is committed, without holding up the next render
+                    saved.add_done_callback(lambda _: generation_events.publish(id))
+        finally:
+            # Mark it finished even if generation failed, so the preview stops waiting
+            print(f"Generated paths: {paths}")
+            with tracer.span("db_update"):
+                db.update('gens', Generation(id=id, done=True)).result()
+            generation_events.publish(id)
+    return True
+
+
+generation_queue = Job_Queue(generate_and_save, workers=config.GENERATION_WORKERS,
+                             max_pending=config.GENERATION_QUEUE_SIZE,
+                             persist_path=config.GENERATION_PENDING_PATH, name="generation")
+
+
+def stop_generation_queue():
+    if not generation_queue.shutdown(timeout=config.GENERATION_SHUTDOWN_TIMEOUT):
+        logger.warning("Generation workers still running at shutdown; their jobs will run again on the next start")
+    # Commit whatever the workers left queued, once they have stopped writing
+    db.close()
+    tracer.shutdown()
+
+
 # Our FastHTML app
 app = FastHTML(hdrs=(
     picolink,
     gridlink,
-    app_css
-))
+    app_css,
+    sse_ext,
+    busy_swap
+), on_startup=[setup_gens_db, generation_queue.start, start_warm_up], on_shutdown=[stop_generation_queue])
+
+
+# Each browser session gets one id, which its event stream and watched generations hang off
+def get_client_id(session):
+    if 'client_id' not in session:
+        session['client_id'] = secrets.token_hex(8)
+    return session['client_id']
 
 
 # Main page
 @app.get("/")
-def home():
+def home(session):
+    client_id = get_client_id(session)
     inp = Input(id="new-prompt", name="prompt", placeholder="Enter a prompt")
     add = Form(Group(inp, Button("Generate")), hx_post="/", target_id='gen-list', hx_swap="afterbegin")
-    gen_containers = [generation_preview(g) for g in gens(limit=10)]  # Start with last 10
-    gen_list = Div(*reversed(gen_containers), id='gen-list', cls="row")  # flexbox container: class = row
+    gen_list = Div(*gallery_items(client_id), id='gen-list', cls="row")  # flexbox container: class = row
+    # One event stream per page carries the updates for every pending card in it
+    updates = Div(gen_list, hx_ext="sse", sse_connect="/events")
     return Title('Meme Do'), Main(section_header(
                 "MEME IS IN THE AIR", "Search about your favourite match and get memes",
                 "Create custom viral memes instantly",
-                max_width=21, center=False), add, gen_list, cls='container')
+                max_width=21, center=False), add, updates, cls='container')
 
 
-# Show the image (if available) and prompt for a generation
+# Previews for one gallery page, then a placeholder that loads the next page once scrolled into view
+def gallery_items(client_id, before: str = None):
+    rows, cursor = gallery_page(before)
+    for g in rows:
+        if not g.done:
+            generation_events.watch(client_id, g.id)
+    items = [generation_preview(g) for g in rows]
+    if cursor:
+        items.append(Div(P("Loading more memes..."), hx_get=f"/gallery?before={cursor}", hx_trigger="revealed",
+                         hx_swap="outerHTML", cls="row justify-content-md-center"))
+    return items
+
+
+# The next gallery page, for infinite scroll
+@app.get("/gallery")
+def gallery(session, before: str = None):
+    try:
+        return tuple(gallery_items(get_client_id(session), before))
+    except Bad_Cursor:
+        return Response("Bad cursor", status_code=400)
+
+
+# The same gallery pages as JSON
+@app.get("/api/gallery")
+def gallery_api(before: str = None, limit: int = None):
+    try:
+        rows, cursor = gallery_page(before, min(limit or config.GALLERY_PAGE_SIZE, 100))
+    except Bad_Cursor:
+        return JSONResponse({'error': 'bad cursor'}, status_code=400)
+    items = [{'id': g.id, 'prompt': g.prompt, 'paths': generation_image_paths(g.id), 'done': bool(g.done),
+              'created_at': g.created_at} for g in rows]
+    return JSONResponse({'items': items, 'next': cursor})
+
+
+# Images rendered so far and the prompt, or the current status while there are none
+def generation_card(g):
+    grid_cls = "row justify-content-md-center"
+    image_paths = generation_image_paths(g.id)
+    images = [Img(src=image_path, alt="Card image", cls="card-img-top padding-10 img-max") for image_path in image_paths]
+    if g.done:
+        if not images:
+            return Card(P(B("Couldn't cook any memes for this one. Please try another prompt.")),
+                        Div(P(B("Prompt: "), g.prompt, cls="card-text margin-top-20 margin-left-20"), cls=grid_cls))
+        return Card(*images,
+                    Div(P(B("Prompt: "), g.prompt, cls="card-text margin-top-20 margin-left-20"), cls=grid_cls),
+                    )
+    position = generation_queue.position(g.id)
+    if position:
+        status = f'Queued, position {position}. Please have patience...'
+    elif images:
+        status = f'{len(images)} ready, more memes cooking...'
+    else:
+        status = 'Cooking Memes For You!! Please have patience...'
+    return Card(*images, Img(src="memedo/ui-assets/jake-cooking.gif", cls="card-img-top"),
+                Div(P(B(status)), cls="card-text margin-top-20 margin-left-20"))
+
+
+# Show the images (if available) and prompt for a generation. An unfinished one is
+# replaced by whatever arrives as its "gen-{id}" event on the page's event stream
 def generation_preview(g):
     grid_cls = "row justify-content-md-center"
-    image_paths = json.loads(g.paths)
-    if len(image_paths) > 0:
-        images = [Img(src=image_path, alt="Card image", cls="card-img-top padding-10 img-max") for image_path in image_paths]
-        return Div(Card(*images,
-                        Div(P(B("Prompt: "), g.prompt, cls="card-text margin-top-20 margin-left-20"), cls=grid_cls),
-                        ), id=f'gen-{g.id}', cls=grid_cls)
-    return Div(Card(Img(src="memedo/ui-assets/jake-cooking.gif", cls="card-img-top")),
-               Div(P(B('Cooking Memes For You!! Please have patience...')), cls="card-text margin-top-20 margin-left-20"),
-               id=f'gen-{g.id}', hx_get=f"/gens/{g.id}",
-               hx_trigger="every 2s", hx_swap="outerHTML", cls=grid_cls)
-
-
-# A pending preview keeps polling this route until we return the image preview
+    if g.done:
+        # Finished generations never change, so their markup is rendered once
+        return NotStr(card_cache.get(g.id, lambda: to_xml(Div(generation_card(g), id=f'gen-{g.id}', cls=grid_cls))))
+    return Div(generation_card(g), id=f'gen-{g.id}', sse_swap=f"gen-{g.id}", hx_swap="outerHTML", cls=grid_cls)
+
+
+# The current preview for a generation
 @app.get("/gens/{id}")
 def preview(id: int):
-    print(gens.get(id))
     return generation_preview(gens.get(id))
 
 
-# For images, CSS, etc.
+async def client_event_stream(client_id: str):
+    sent = {}
+    # Subscribe before the first read, so an update between the two isn't missed
+    with generation_events.subscribe(client_id) as updates:
+        changed = generation_events.watched(client_id)
+        while True:
+            for id in changed:
+                try:
+                    g = gens.get(id)
+                except NotFoundError:
+                    generation_events.unwatch(client_id, id)
+                    continue
+                preview = to_xml(generation_preview(g))
+                if sent.get(id) != preview:
+                    yield sse_message(preview, event=f"gen-{id}")
+                    sent[id] = preview
+                if g.done:
+                    generation_events.unwatch(client_id, id)
+                    sent.pop(id, None)
+            try:
+                changed = {await asyncio.wait_for(updates.get(), timeout=config.SSE_KEEPALIVE_SECONDS)}
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                changed = set()
+            # Coalesce a burst of updates into one render per generation
+            while not updates.empty():
+                changed.add(updates.get_nowait())
+
+
+# Server-sent events with the latest preview of every generation this client watches
+@app.get("/events")
+def client_events(session):
+    return EventStream(client_event_stream(get_client_id(session)))
+
+
+# 200 once the database is set up, the catalogue is built and the render workers have warmed up, 503 until then
+@app.get("/ready")
+def ready():
+    is_ready = all(readiness.values())
+    body = {'ready': is_ready, **readiness, 'uptime_seconds': round(time.monotonic() - started_at, 3)}
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+
+# Queue depth and wait times for the generation workers
+@app.get("/stats/queue")
+def queue_stats():
+    return JSONResponse(generation_queue.stats())
+
+
+# Connected clients and event streams
+@app.get("/stats/events")
+def event_stats():
+    return JSONResponse(generation_events.stats())
+
+
+# Write batching on the generations database
+@app.get("/stats/db")
+def db_stats():
+    return JSONResponse(db.stats())
+
+
+# Decoded template caches of the render workers
+@app.get("/stats/templates")
+def template_stats():
+    return JSONResponse(template_cache_stats())
+
+
+# Requests and bytes served by the static route
+@app.get("/stats/static")
+def static_file_stats():
+    return JSONResponse(static_stats.stats())
+
+
+# Generation stage durations (summary, selection, render, encode, save, db_update) as Prometheus histograms
+@app.get("/metrics")
+def metrics():
+    return Response(tracer.metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# For images, CSS, etc., with cache headers, conditional GETs and ranges
 @app.get("/{fname:path}.{ext:static}")
-def static(fname: str, ext: str): return FileResponse(f'{fname}.{ext}')
+def static(fname: str, ext: str, req): return static_file_response(f'{fname}.{ext}', req.headers)
 
 
 # Generation route
 @app.post("/")
-def post(prompt: str):
+def post(prompt: str, session):
     clear_input = Input(id="new-prompt", name="prompt", placeholder="Enter a prompt", hx_swap_oob='true')
     if len(prompt) > 3:
-        g = gens.insert(Generation(prompt=prompt, paths=[]))
-        generate_and_save(prompt, g.id)
+        g = Generation(prompt=prompt, paths='[]', done=False, created_at=time.time())
+        g.id = db.insert('gens', g).result()
+        try:
+            generation_queue.submit(g.id, prompt)
+        except Queue_Full:
+            db.write("DELETE FROM gens WHERE id = ?", [g.id]).result()
+            busy = Div(Card(P(B('Too many memes cooking right now. Please try again in a minute.'))),
+                       cls="row justify-content-md-center")
+            return HTMLResponse(to_xml(busy) + to_xml(clear_input), status_code=429, headers={"Retry-After": "30"})
+        generation_events.watch(get_client_id(session), g.id)
         return generation_preview(g), clear_input
     return clear_input
 
 
-# Generate an image and save it to the folder (in a separate thread)
-@threaded
-def generate_and_save(prompt: str, id: int):
-    # paths = ['memedo/out/creations/20241018011430141900.jpg', 'memedo/out/creations/20241018011430169624.jpg',
-    #          'memedo/out/creations/20241018011430313254.jpg', 'memedo/out/creations/20241018011430329335.jpg',
-    #          'memedo/out/creations/20241018011430421782.jpg']
-    paths = generate_images(prompt)
-    print(f"Generated paths: {paths}")
-    image_path = paths[0]
-    gens.update(Generation(id=id, paths=paths))
-
-    Image.open(image_path)
-    return True
-
-
 if __name__ == '__main__':
     uvicorn.run(app, host='localhost', port=int(os.getenv("PORT", default=5000)))
@@ -0,0 +1,180 @@
+"""
+Pre-render meme packs for many prompts at once, straight into the gallery.
+
+    python batch_generate.py prompts.jsonl [--llm-concurrency 8] [--render-concurrency 2]
+                                          [--num-memes 5] [--checkpoint prompts.jsonl.done]
+
+Each input line is a JSON object with a "prompt" and optionally a "key"
+(defaults to the prompt) that identifies it in the checkpoint. Prompts go
+through a two-stage pipeline: match summary and meme selection (at most
+`--llm-concurrency` prompts talking to the LLMs at once), then rendering (at
+most `--render-concurrency` prompts feeding the render pool at once), so the
+next prompts' LLM calls overlap the current ones' renders.
+
+Every finished prompt becomes a done generation in the gens table, with its
+images, and its key is appended to the checkpoint file. Running the same
+command again skips the keys already there, so an interrupted batch resumes
+where it stopped. Failed prompts, including ones where no meme rendered,
+aren't checkpointed and are retried; a key listed twice runs once.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from loguru import logger
+
+import app
+from memedo.ai_agents import meme_agent, summary_agent
+from memedo.ai_agents.meme_agent import generate_meme_content_async
+from memedo.ai_agents.summary_agent import get_match_summary_cached_async
+from memedo.controllers.meme_generator import render_memes_as_completed, shutdown_render_pool
+from memedo.models.template_registry import template_registry
+from memedo.utils.tracing import tracer
+from memedo import config
+
+
+def read_prompts(path):
+    prompts = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("prompt"):
+                raise ValueError(f"{path}:{line_number} has no prompt")
+            prompts.append({"key": str(item.get("key") or item["prompt"]), "prompt": item["prompt"]})
+    return prompts
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return {entry["key"]: entry["generation_id"] for entry in entries}
+
+
+def render_and_save(generation_id, generated_memes):
+    """Render one prompt's memes and save each result as it finishes (runs in a thread). Returns the paths."""
+    paths, saved = [], []
+    for result in render_memes_as_completed(generated_memes):
+        if result["status"] == "ok":
+            result["path"] = f"{app.BASE_IMAGE_PATH}{result['file_name']}"
+            paths.append(result["path"])
+        saved.append(app.save_image_result(generation_id, result))
+    for future in saved:
+        future.result()
+    return paths
+
+
+async def finish(future):
+    """Wait for an asyncio future to be done, even if this task is cancelled meanwhile."""
+    while not future.done():
+        try:
+            await asyncio.wait([future])
+        except asyncio.CancelledError:
+            pass
+
+
+class Batch:
+    def __init__(self, checkpoint_path, llm_concurrency, render_concurrency, num_memes, top_k):
+        self.checkpoint_path = checkpoint_path
+        self.llm_slots = asyncio.Semaphore(llm_concurrency)
+        self.render_slots = asyncio.Semaphore(render_concurrency)
+        self.num_memes = num_memes
+        self.top_k = top_k
+        self.counts = {"done": 0, "failed": 0, "memes": 0}
+
+    async def run_one(self, item):
+        started = time.perf_counter()
+        try:
+            async with self.llm_slots:
+                with tracer.span("summary"):
+                    summary = await get_match_summary_cached_async(item["prompt"])
+                with tracer.span("selection"):
+                    memes = await generate_meme_content_async(summary, template_registry.catalogue(),
+                                                              self.num_memes, self.top_k)
+            generated_memes = memes["memes"]
+            async with self.render_slots:
+                g = app.Generation(prompt=item["prompt"], paths='[]', done=False, created_at=time.time())
+                g.id = await asyncio.wrap_future(app.db.insert('gens', g))
+                # The generation row only exists from here, so its trace starts with the renders
+                with tracer.generation(g.id):
+                    # Shielded: cancelling can't stop the thread, and it keeps saving rows until it returns
+                    render = asyncio.ensure_future(asyncio.to_thread(render_and_save, g.id, generated_memes))
+                    try:
+                        paths = await asyncio.shield(render)
+                        if not paths:
+                            raise RuntimeError(f"None of the {len(generated_memes)} memes rendered")
+                    except BaseException:
+                        # The prompt isn't checkpointed and the next run inserts it again, so don't leave this
+                        # partial generation in the gallery next to it. Once the renders have stopped saving
+                        await finish(render)
+                        app.db.write("DELETE FROM generated_images WHERE generation_id = ?", [g.id])
+                        await finish(asyncio.wrap_future(app.db.write("DELETE FROM gens WHERE id = ?", [g.id])))
+                        raise
+                    with tracer.span("db_update"):
+                        await asyncio.wrap_future(app.db.update('gens', app.Generation(id=g.id, done=True)))
+        except Exception:
+            logger.exception(f"Prompt {item['key']!r} failed; it will be retried on the next run")
+            self.counts["failed"] += 1
+            return
+        self.counts["done"] += 1
+        self.counts["memes"] += len(paths)
+        # Appending one short line is atomic enough that a crash loses at most this entry
+        with open(self.checkpoint_path, "a") as f:
+            f.write(json.dumps({"key": item["key"], "generation_id": g.id, "memes": len(paths)}) + "\n")
+        logger.info(f"Prompt {item['key']!r}: generation {g.id}, {len(paths)} memes in "
+                    f"{time.perf_counter() - started:.1f}s")
+
+    async def run(self, items):
+        try:
+            await asyncio.gather(*(self.run_one(item) for item in items))
+        finally:
+            await summary_agent.aclose_async_client()
+            await meme_agent.aclose_async_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("prompts", help="JSONL file of {\"prompt\": ..., \"key\": ...}")
+    parser.add_argument("--checkpoint", help="finished keys are appended here (default: <prompts>.done)")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="prompts in the LLM stage at once")
+    parser.add_argument("--render-concurrency", type=int, default=config.RENDER_WORKERS,
+                        help="prompts in the render stage at once")
+    parser.add_argument("--num-memes", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=None, help="templates described to the LLM (default: config)")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or f"{args.prompts}.done"
+    items = read_prompts(args.prompts)
+    finished = read_checkpoint(checkpoint_path)
+    # A key listed twice runs once, under its first prompt
+    todo, seen = [], set()
+    for item in items:
+        if item["key"] not in finished and item["key"] not in seen:
+            seen.add(item["key"])
+            todo.append(item)
+    done = sum(item["key"] in finished for item in items)
+    logger.info(f"{len(items)} prompts, {done} already done, {len(items) - done - len(todo)} duplicate keys, "
+                f"{len(todo)} to go")
+
+    app.setup_gens_db()
+    batch = Batch(checkpoint_path, args.llm_concurrency, args.render_concurrency, args.num_memes, args.top_k)
+    started = time.perf_counter()
+    try:
+        asyncio.run(batch.run(todo))
+    finally:
+        shutdown_render_pool()
+        app.db.close()
+        tracer.shutdown()
+    logger.info(f"Batch finished in {time.perf_counter() - started:.1f}s: {batch.counts['done']} done, "
+                f"{batch.counts['failed']} failed, {batch.counts['memes']} memes rendered")
+    if batch.counts["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
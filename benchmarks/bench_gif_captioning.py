@@ -0,0 +1,75 @@
+"""
+Compare GIF captioning modes for render time and output size.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_gif_captioning [--repeat 3] [--modes palette numpy]
+
+Every GIF in the meme template directory is captioned with each mode in
+`BaseGIFTemplate.caption_mode`; outputs go to a temporary directory.
+"""
+import argparse
+import glob
+import os
+import statistics
+import tempfile
+import time
+
+from memedo.models.meme_template import BaseGIFTemplate
+
+MODES = ["per_frame", "layer", "numpy", "palette"]
+CAPTION = "Yuzvendra Chahal after the match celebrating like he won it alone"
+
+
+def make_template(gif_path, mode, output_dir):
+    stem, extension = os.path.splitext(os.path.basename(gif_path))
+
+    class Bench_Template(BaseGIFTemplate):
+        name = stem
+        caption_mode = mode
+        template_gif_dir = os.path.dirname(gif_path)
+        template_output_gif_dir = output_dir
+
+    template = Bench_Template()
+    template.extension = extension.lstrip(".")
+    return template
+
+
+def run(gif_paths, modes, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for gif_path in gif_paths:
+            for mode in modes:
+                template = make_template(gif_path, mode, output_dir)
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    gif_name = template.create_captioned_gif(CAPTION, position=(40, 200), font_size=25,
+                                                             text_color="white")
+                    timings.append(time.perf_counter() - start)
+                results.append({
+                    "template": os.path.basename(gif_path),
+                    "mode": mode,
+                    "seconds": statistics.median(timings),
+                    "bytes": os.path.getsize(os.path.join(output_dir, gif_name)),
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--templates", nargs="*", help="GIF paths (default: every template GIF)")
+    args = parser.parse_args()
+
+    gif_paths = args.templates or sorted(glob.glob(f"{BaseGIFTemplate.template_gif_dir}/*.gif"))
+    results = run(gif_paths, args.modes, args.repeat)
+
+    print(f"{'template':<36} {'mode':<10} {'seconds':>8} {'bytes':>10}")
+    for result in results:
+        print(f"{result['template']:<36} {result['mode']:<10} {result['seconds']:>8.3f} {result['bytes']:>10}")
+
+
+if __name__ == "__main__":
+    main()
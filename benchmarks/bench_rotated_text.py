@@ -0,0 +1,102 @@
+"""
+Check and time rotated captions in `Image_Manager.add_text`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rotated_text [--repeat 20] [--tolerance 0.02]
+
+Each rotated caption a template declares is rendered twice: with the old
+approach (draw on a full-size overlay, rotate the whole overlay) and with
+`add_text`, which rotates only the text's bounding box. The canvas is also
+scaled up to show how each approach grows with template resolution.
+
+The run fails (exit code 1) if the share of caption pixels that differ
+between the two goes over the tolerance. A few glyph-edge pixels are
+expected to differ because Pillow's nearest-neighbour sampling rounds
+slightly differently over a cropped range.
+"""
+import argparse
+import sys
+import timeit
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from memedo.models.meme_template import BaseMemeTemplate, meme_templates
+from memedo.utils.image_processor import Image_Manager, font_path, font_registry, wrap
+
+SAMPLE_TEXT = "Learning to code is one of the most rewarding experiences"
+SCALES = (1, 2, 4)
+
+
+def full_overlay_rotate(base, text, position, font_size, text_color, wrapped_width, rotate_degrees):
+    overlay_image = Image.new("RGBA", base.size, (0, 0, 0, 0))
+    if wrapped_width is not None:
+        text = wrap(text, wrapped_width)
+    fill = (255, 255, 255, 255) if text_color == "white" else (0, 0, 0, 255)
+    ImageDraw.Draw(overlay_image).text(position, text, font=font_registry.get(font_path, font_size), fill=fill)
+    return overlay_image.rotate(rotate_degrees)
+
+
+def rotated_captions():
+    for template in meme_templates:
+        if not issubclass(template, BaseMemeTemplate):
+            continue
+        for box in template.captions:
+            if box.rotate_degrees:
+                yield template.__name__, box
+
+
+def run(repeat):
+    results = []
+    for template_name, box in rotated_captions():
+        for scale in SCALES:
+            # Canvas size stands in for template resolution; the caption stays put
+            base = Image.new("RGBA", (1200 * scale, 1200 * scale), (128, 128, 128, 255))
+            args = (base, SAMPLE_TEXT, box.position, box.font_size, box.text_color, box.wrapped_width,
+                    box.rotate_degrees)
+
+            expected = np.asarray(full_overlay_rotate(*args), dtype=np.int16)
+            actual = np.asarray(Image_Manager.add_text(*args[:4], text_color=box.text_color,
+                                                       wrapped_width=box.wrapped_width,
+                                                       rotate_degrees=box.rotate_degrees), dtype=np.int16)
+            text_pixels = max(1, int(((expected[..., 3] > 0) | (actual[..., 3] > 0)).sum()))
+            differing = int((np.abs(expected - actual).max(axis=-1) > 0).sum())
+
+            old = timeit.timeit(lambda: full_overlay_rotate(*args), number=repeat) / repeat
+            new = timeit.timeit(lambda: Image_Manager.add_text(*args[:4], text_color=box.text_color,
+                                                               wrapped_width=box.wrapped_width,
+                                                               rotate_degrees=box.rotate_degrees),
+                                number=repeat) / repeat
+            results.append({
+                "caption": f"{template_name}.{box.field}",
+                "canvas": base.size,
+                "old_ms": old * 1000,
+                "new_ms": new * 1000,
+                "differing": differing / text_pixels,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="max share of caption pixels allowed to differ")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print(f"{'caption':<36} {'canvas':>11} {'old ms':>8} {'new ms':>8} {'speedup':>8} {'differing':>10}")
+    failed = False
+    for result in results:
+        canvas = "x".join(str(v) for v in result["canvas"])
+        print(f"{result['caption']:<36} {canvas:>11} {result['old_ms']:>8.2f} {result['new_ms']:>8.2f} "
+              f"{result['old_ms'] / result['new_ms']:>7.1f}x {result['differing']:>10.2%}")
+        failed |= result["differing"] > args.tolerance
+    if failed:
+        print(f"FAIL: rotated text differs from the full-overlay rotation by more than {args.tolerance:.2%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measure how long a fresh worker takes to import the app and to become ready.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [--repeat 5] [--top 15] [--budget-ms 2500] [--ready]
+
+Each run imports `app` in a new interpreter with `-X importtime` and reports
+the median wall time of the import and the modules with the largest
+cumulative import time (from the median run). With `--ready`, a server is
+also started on a throwaway database and polled until /ready returns 200,
+which includes building the catalogue and starting the render workers (each
+loading its fonts and templates). Exits with status 1 if the median import
+is over `--budget-ms`.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.load_test_updates import free_port
+
+
+def app_env(workdir):
+    env = dict(os.environ,
+               MEMEDO_GENS_DB_PATH=os.path.join(workdir, "gens.db"),
+               MEMEDO_GENERATION_PENDING_PATH=os.path.join(workdir, "pending_jobs.jsonl"))
+    env.setdefault("OPENAI_API_KEY", "stub")
+    return env
+
+
+def parse_importtime(stderr):
+    """{module: (self us, cumulative us)} from `-X importtime` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def time_import(env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    return time.perf_counter() - start, parse_importtime(result.stderr)
+
+
+def time_to_ready(env, timeout=120):
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    serving = None
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1)
+            except httpx.HTTPError:
+                time.sleep(0.05)
+                continue
+            serving = serving or time.perf_counter() - start
+            if response.status_code == 200:
+                return serving, time.perf_counter() - start
+            time.sleep(0.05)
+        raise RuntimeError("server did not become ready")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if the median import takes longer")
+    parser.add_argument("--ready", action="store_true", help="also time a server start until /ready is 200")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = app_env(workdir)
+        runs = sorted((time_import(env) for _ in range(args.repeat)), key=lambda run: run[0])
+        seconds, modules = runs[len(runs) // 2]
+        ready = time_to_ready(env) if args.ready else None
+
+    print(f"import app: median {seconds * 1000:.0f} ms over {args.repeat} runs "
+          f"(min {runs[0][0] * 1000:.0f}, max {runs[-1][0] * 1000:.0f}), interpreter start included")
+    print(f"{'cumulative ms':>13} {'self ms':>8}  module")
+    for name, (self_us, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"{cumulative_us / 1000:>13.1f} {self_us / 1000:>8.1f}  {name}")
+    if ready:
+        print(f"server accepting requests after {ready[0]:.2f}s, /ready after {ready[1]:.2f}s")
+
+    if args.budget_ms is not None and seconds * 1000 > args.budget_ms:
+        print(f"over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
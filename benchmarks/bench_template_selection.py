@@ -0,0 +1,104 @@
+"""
+Measure meme prompt size and latency as the template catalogue grows.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_template_selection [--sizes 18 100 500] [--top-k 8] [--repeat 3]
+
+The real templates are cloned (with new ids and names) up to each catalogue
+size. For each size the prompt is built with the whole catalogue and with
+only the top-K templates picked by `template_selector`, and the meme request
+is sent to the local stub LLM server, which charges `--delay-per-1k-tokens`
+seconds for prompt processing on top of `--delay`.
+"""
+import argparse
+import os
+import statistics
+import time
+
+# The stub server doesn't check the key, but the OpenAI client wants one
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+from loguru import logger
+from openai import OpenAI
+
+from memedo.ai_agents import meme_agent
+from memedo.ai_agents.stub_server import start_stub_server
+from memedo.models.template_registry import template_registry
+
+SUMMARY = ("Rohit Sharma walked out like a king and walked back like a tourist. New Zealand's spinners "
+           "ran through the batting, the crowd went silent and the captain blamed the pitch. Kohli "
+           "dropped a sitter, fans are furious and the coach looks like he wants to retire tonight.")
+SIZES = [18, 50, 100, 200, 500]
+
+
+def base_catalogue():
+    return [dict(meme) for meme in template_registry.catalogue()]
+
+
+def grow_catalogue(base, size):
+    catalogue = list(base)
+    copy = 1
+    while len(catalogue) < size:
+        for meme in base[:size - len(catalogue)]:
+            catalogue.append(dict(meme, id=meme["id"] + 1000 * copy, name=f"{meme['name']}_{copy}"))
+        copy += 1
+    return catalogue
+
+
+def median_seconds(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def run(sizes, top_k, repeat, num_memes):
+    base = base_catalogue()
+    results = []
+    for size in sizes:
+        catalogue = grow_catalogue(base, size)
+        for label, k in (("full", 0), (f"top-{top_k}", top_k)):
+            prompt = meme_agent.build_meme_prompt(SUMMARY, catalogue, num_memes, top_k=k)
+            results.append({
+                "templates": size,
+                "mode": label,
+                "tokens": meme_agent.count_tokens(prompt),
+                "build_ms": median_seconds(
+                    lambda: meme_agent.build_meme_prompt(SUMMARY, catalogue, num_memes, top_k=k), repeat) * 1000,
+                "end_to_end_s": median_seconds(
+                    lambda: meme_agent.generate_meme_content(SUMMARY, catalogue, num_memes, top_k=k), repeat),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--num-memes", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--delay", type=float, default=0.2, help="stub LLM base latency in seconds")
+    parser.add_argument("--delay-per-1k-tokens", type=float, default=0.02,
+                        help="stub LLM prompt processing time per thousand tokens")
+    args = parser.parse_args()
+
+    server = start_stub_server(delay=args.delay, delay_per_1k_tokens=args.delay_per_1k_tokens)
+    meme_agent.client = OpenAI(api_key="stub", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    # The agent logs every response; keep the table readable
+    logger.disable("memedo")
+    try:
+        results = run(args.sizes, args.top_k, args.repeat, args.num_memes)
+    finally:
+        server.shutdown()
+
+    print(f"{'templates':>9} {'mode':<8} {'tokens':>8} {'build ms':>9} {'end to end s':>13}")
+    for result in results:
+        print(f"{result['templates']:>9} {result['mode']:<8} {result['tokens']:>8} {result['build_ms']:>9.2f} "
+              f"{result['end_to_end_s']:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
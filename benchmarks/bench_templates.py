@@ -0,0 +1,159 @@
+"""
+Render every meme template and report latency, memory and output size.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_templates [--repeat 10] [--templates 10 31] [--json results.json]
+                                         [--compare previous.json]
+
+Each template renders in its own subprocess, so peak RSS is that template's
+alone. The captions are the `meme_creation_input` examples from the
+template's `instruction`, cycled over `--repeat` timed renders after one
+untimed first render (reported separately as cold). Outputs go to a
+temporary directory.
+
+Static and GIF templates are reported in separate tables. `--json` writes
+the results, with the commit they were measured on; `--compare` prints each
+template's p95 and peak RSS change against an earlier results file.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from memedo.models.meme_template import BaseGIFTemplate
+from memedo.models.template_registry import template_registry
+
+def template_kind(template):
+    return "gif" if issubclass(template, BaseGIFTemplate) else "image"
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(template_id, repeat, output_dir):
+    """Render one template `repeat` times in this process (the subprocess side)."""
+    examples = template_registry.metadata(template_id)["example_inputs"]
+    template = template_registry.get(template_id)()
+    template.output_image_dir = template.template_output_gif_dir = output_dir
+    rss_before = peak_rss_mb()
+
+    start = time.perf_counter()
+    file_name = template.create(examples[0])
+    cold_ms = (time.perf_counter() - start) * 1000
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        file_name = template.create(examples[i % len(examples)])
+        timings.append((time.perf_counter() - start) * 1000)
+
+    from PIL import Image
+    path = os.path.join(output_dir, file_name)
+    with Image.open(path) as image:
+        frames = getattr(image, "n_frames", 1)
+    return {
+        "id": template_id,
+        "name": template.name,
+        "kind": template_kind(type(template)),
+        "examples": len(examples),
+        "cold_ms": cold_ms,
+        "p50_ms": percentile(timings, 0.5),
+        "p95_ms": percentile(timings, 0.95),
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_growth_mb": peak_rss_mb() - rss_before,
+        "bytes": os.path.getsize(path),
+        "frames": frames,
+    }
+
+
+def measure_in_subprocess(template_id, repeat):
+    with tempfile.TemporaryDirectory() as output_dir:
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_templates", "--child", str(template_id),
+             "--repeat", str(repeat), "--output-dir", output_dir],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+    if result.returncode != 0:
+        template = template_registry.get(template_id)
+        return {"id": template_id, "name": template.name, "kind": template_kind(template),
+                "error": result.stderr.strip()}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(title, results, previous):
+    print(f"\n{title}")
+    print(f"{'id':>4} {'template':<30} {'cold ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'peak MB':>8} {'frames':>6} "
+          f"{'bytes':>9}" + (f" {'p95 chg':>8} {'RSS chg':>8}" if previous else ""))
+    for result in results:
+        if "error" in result:
+            print(f"{result['id']:>4} {result['name']:<30} failed: {result['error'].splitlines()[-1]}")
+            continue
+        line = (f"{result['id']:>4} {result['name'][:30]:<30} {result['cold_ms']:>8.1f} {result['p50_ms']:>8.1f} "
+                f"{result['p95_ms']:>8.1f} {result['peak_rss_mb']:>8.1f} {result['frames']:>6} {result['bytes']:>9}")
+        before = previous.get(result["id"])
+        if before and "error" not in before:
+            line += (f" {100 * (result['p95_ms'] / before['p95_ms'] - 1):>+7.0f}%"
+                     f" {result['peak_rss_mb'] - before['peak_rss_mb']:>+7.1f}M")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="timed renders per template")
+    parser.add_argument("--templates", type=int, nargs="*", help="template ids (default: all)")
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--compare", help="results file from an earlier run to compare against")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(measure(args.child, args.repeat, args.output_dir)))
+        return
+
+    template_ids = args.templates or [template.id for template in template_registry]
+    results = [measure_in_subprocess(template_id, args.repeat) for template_id in template_ids]
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {result["id"]: result for result in json.load(f)["results"]}
+
+    print_table("Static templates", [r for r in results if r["kind"] == "image"], previous)
+    print_table(f"GIF templates (caption mode {BaseGIFTemplate.caption_mode})",
+                [r for r in results if r["kind"] == "gif"], previous)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "gif_caption_mode": BaseGIFTemplate.caption_mode,
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
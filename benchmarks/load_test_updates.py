@@ -0,0 +1,160 @@
+"""
+Compare server load of htmx polling against the multiplexed event stream.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test_updates [--clients 200] [--pending 5] [--duration 30]
+
+A server is started on a throwaway database holding `--pending` unfinished
+generations, and every simulated client waits on all of them:
+
+- poll: each card re-fetches /gens/{id} every `--interval` seconds, the way
+  pending cards used to with hx_trigger="every 2s"
+- push: one GET / then a single /events stream per client
+
+Reported per mode: requests sent, request rate, and the CPU time the server
+process used over the run (read from /proc, so Linux only). Raise the open
+file limit (ulimit -n) before trying thousands of clients.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def create_pending_generations(db_path, count):
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE gens ([prompt] TEXT, [id] INTEGER PRIMARY KEY, [paths] TEXT, [done] INTEGER)")
+    db.executemany("INSERT INTO gens (prompt, paths, done) VALUES (?, '[]', 0)",
+                   [(f"load test prompt {i}",) for i in range(count)])
+    db.commit()
+    ids = [row[0] for row in db.execute("SELECT id FROM gens")]
+    db.close()
+    return ids
+
+
+def start_server(port, workdir):
+    env = dict(os.environ,
+               MEMEDO_GENS_DB_PATH=os.path.join(workdir, "gens.db"),
+               MEMEDO_GENERATION_PENDING_PATH=os.path.join(workdir, "pending_jobs.jsonl"))
+    env.setdefault("OPENAI_API_KEY", "stub")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats/queue", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+
+async def poll_client(base_url, ids, interval, duration, counts):
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        # Cards were loaded at different times, so their polls aren't in step
+        await asyncio.sleep(random.uniform(0, interval))
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for id in ids:
+                try:
+                    await client.get(f"/gens/{id}")
+                    counts["requests"] += 1
+                except httpx.HTTPError:
+                    counts["errors"] += 1
+            await asyncio.sleep(interval)
+
+
+async def push_client(base_url, duration, counts):
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        try:
+            await client.get("/")
+            counts["requests"] += 1
+            async with client.stream("GET", "/events") as stream:
+                counts["requests"] += 1
+                async for chunk in stream.aiter_raw():
+                    counts["events"] += chunk.count(b"event:")
+        except httpx.HTTPError:
+            counts["errors"] += 1
+
+
+async def run_mode(mode, base_url, clients, ids, interval, duration):
+    counts = {"requests": 0, "errors": 0, "events": 0}
+    if mode == "poll":
+        tasks = [poll_client(base_url, ids, interval, duration, counts) for _ in range(clients)]
+        await asyncio.gather(*tasks)
+    else:
+        tasks = [asyncio.ensure_future(push_client(base_url, duration, counts)) for _ in range(clients)]
+        await asyncio.sleep(duration)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--pending", type=int, default=5, help="unfinished generations each client waits on")
+    parser.add_argument("--interval", type=float, default=2.0, help="polling interval in seconds")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per mode")
+    parser.add_argument("--modes", nargs="+", default=["poll", "push"], choices=["poll", "push"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        ids = create_pending_generations(os.path.join(workdir, "gens.db"), args.pending)
+        port = free_port()
+        server = start_server(port, workdir)
+        try:
+            results = []
+            for mode in args.modes:
+                cpu_before = server_cpu_seconds(server.pid)
+                start = time.monotonic()
+                counts = asyncio.run(run_mode(mode, f"http://127.0.0.1:{port}", args.clients, ids,
+                                              args.interval, args.duration))
+                elapsed = time.monotonic() - start
+                cpu_after = server_cpu_seconds(server.pid)
+                cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+                results.append((mode, counts, elapsed, cpu))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{args.clients} clients, {args.pending} pending generations each, {args.duration:.0f}s per mode")
+    print(f"{'mode':<6} {'requests':>9} {'req/s':>8} {'errors':>7} {'server cpu s':>13} {'cpu %':>6}")
+    for mode, counts, elapsed, cpu in results:
+        cpu_text = f"{cpu:>13.2f} {100 * cpu / elapsed:>5.1f}%" if cpu is not None else f"{'n/a':>13} {'n/a':>6}"
+        print(f"{mode:<6} {counts['requests']:>9} {counts['requests'] / elapsed:>8.1f} {counts['errors']:>7} {cpu_text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,176 @@
+import asyncio
+import functools
 import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-from pydantic import BaseModel
+import weakref
+
 from loguru import logger
 
+from memedo import config
+from memedo.ai_agents.template_selector import select_templates
+
 
-class Meme(BaseModel):
-    id: int
-    meme_creation_input: str
-    reasoning: str
+# openai and pydantic take a third of a second to import, so they are only
+# imported when the first request is made, not when the app starts
+@functools.cache
+def _response_format():
+    from pydantic import BaseModel
 
+    class Meme(BaseModel):
+        id: int
+        meme_creation_input: str
+        reasoning: str
 
-class MemeList(BaseModel):
-    memes: list[Meme]
+    class MemeList(BaseModel):
+        memes: list[Meme]
+
+    return MemeList
 
 
-# Load environment variables
-load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
+client_options = dict(api_key=OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL, timeout=config.LLM_TIMEOUT,
+                      max_retries=config.LLM_MAX_RETRIES)
+# Made on first use; benchmarks may set their own
+client = None
 
 
-def generate_meme_content(summary, memes_info, num_memes=3):
-    """
-    Identifies major events/achievements and recommends meme templates.
+def _get_client():
+    global client
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(**client_options)
+    return client
 
-    Args:
-        summary (str): Summary generated by the summary agent.
-        memes_info (list): List of dictionaries containing meme template information.
-        num_memes (int): Number of memes to generate.
+# AsyncOpenAI's connection pool is bound to the event loop that opened it, so keep one client per loop
+_async_clients = weakref.WeakKeyDictionary()
 
-    Returns:
-        list: List of dictionaries with meme IDs and inputs.
-    """
-    # Construct the prompt
-    prompt = f"""
-You are a very funny and quirky dramatic, slightly offensice drunk commentator tasked with creating memes based on the following match summary:
 
-context:
-{summary}
+def _get_async_client():
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        from openai import AsyncOpenAI
+        async_client = AsyncOpenAI(**client_options)
+        _async_clients[loop] = async_client
+    return async_client
+
+
+async def aclose_async_client():
+    """Close the current event loop's client; call before the loop shuts down."""
+    async_client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if async_client is not None:
+        await async_client.close()
+
+
+CATALOGUE_INTRO = """
+You are a very funny and quirky dramatic, slightly offensice drunk commentator tasked with creating memes based on the match summary given after the templates.
 
 Here are the available meme templates:
 
 """
+
+# Built catalogue prefixes, keyed on the template fields they were built from
+_catalogue_prefixes = {}
+
+
+def _catalogue_key(memes_info):
+    return tuple((meme['id'], meme['name'], meme['description'], meme['instruction']) for meme in memes_info)
+
+
+def count_tokens(text):
+    """Token count for gpt-4o with tiktoken if it is installed, else the usual ~4 chars per token estimate."""
+    try:
+        import tiktoken
+    except ImportError:
+        return len(text) // 4
+    return len(tiktoken.encoding_for_model("gpt-4o").encode(text))
+
+
+def _render_catalogue(memes_info):
+    parts = [CATALOGUE_INTRO]
     for meme in memes_info:
-        prompt += f"ID: {meme['id']}\n"
-        prompt += f"Name: {meme['name']}\n"
-        prompt += f"Description: {meme['description']}\n"
-        prompt += f"Instruction for generation: {meme['instruction']}\n"
-        prompt += "-" * 50 + "\n"
+        parts.append(f"ID: {meme['id']}\n")
+        parts.append(f"Name: {meme['name']}\n")
+        parts.append(f"Description: {meme['description']}\n")
+        parts.append(f"Instruction for generation: {meme['instruction']}\n")
+        parts.append("-" * 50 + "\n")
+    return "".join(parts)
+
+
+def catalogue_prefix(memes_info):
+    """
+    The static start of the prompt: the role and the template catalogue.
+
+    It only changes when the templates do, so it's built once per catalogue
+    and goes first in the prompt, where the provider's prompt cache can reuse it.
+    """
+    key = _catalogue_key(memes_info)
+    prefix = _catalogue_prefixes.get(key)
+    if prefix is None:
+        prefix = _catalogue_prefixes[key] = _render_catalogue(memes_info)
+    return prefix
+
+
+def _selection_size(memes_info, num_memes, top_k):
+    """How many templates a prompt describes when they are picked per summary, or 0 when it sends them all."""
+    top_k = config.TEMPLATE_TOP_K if top_k is None else top_k
+    k = max(top_k, num_memes) if top_k else 0
+    return k if k < len(memes_info) else 0
+
+
+def prepare_catalogue(memes_info, num_memes=5, top_k=None):
+    """
+    Build the stable start of the prompts `build_meme_prompt` will send ahead
+    of the first request, and log its size. That is the whole catalogue, or
+    only the intro when templates are picked per summary (whose index is
+    built here too).
+    """
+    k = _selection_size(memes_info, num_memes, top_k)
+    if k:
+        select_templates("", memes_info, k)
+        logger.info(f"Meme catalogue: top {k} of {len(memes_info)} templates picked per prompt, so only the intro "
+                    f"(~{count_tokens(CATALOGUE_INTRO)} tokens) is a stable prefix")
+        return CATALOGUE_INTRO
+    prefix = catalogue_prefix(memes_info)
+    logger.info(f"Meme catalogue prefix: {len(memes_info)} templates, {len(prefix)} chars, "
+                f"~{count_tokens(prefix)} tokens")
+    return prefix
+
+
+def build_meme_prompt(summary, memes_info, num_memes=3, top_k=None):
+    """
+    The full prompt. With `top_k` set below the catalogue size, only the
+    templates that best match the summary are described, so the prompt stops
+    growing with the catalogue; otherwise the whole cached catalogue is sent.
+    """
+    k = _selection_size(memes_info, num_memes, top_k)
+    if k:
+        catalogue = _render_catalogue(select_templates(summary, memes_info, k))
+    else:
+        catalogue = catalogue_prefix(memes_info)
+    return catalogue + f"""
+context:
+{summary}
 
-    prompt += f"""
 Please choose {num_memes} meme templates from the list above that are most suitable for the match summary provided.
 For each chosen meme, provide the inputs needed to create the meme, based on the match summary.
 Also, provide a brief reasoning for choosing each meme template. Extra hundred dollars if it is controversial and offensive!
 """
 
-    response = client.beta.chat.completions.parse(
+
+def _completion_request(summary, memes_info, num_memes, top_k=None):
+    return dict(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "You are a creative AI assistant specializing in meme generation."},
-            {"role": "user", "content": prompt}
+            {"role": "user", "content": build_meme_prompt(summary, memes_info, num_memes, top_k)}
         ],
         temperature=0.7,
-        response_format=MemeList,
+        response_format=_response_format(),
     )
 
+
+def _parse_memes(response):
     logger.info(response)
     generated_text = response.choices[0].message.content.strip()
 
@@ -77,3 +181,27 @@ Also, provide a brief reasoning for choosing each meme template. Extra hundred d
         return []
 
     return memes_selected
+
+
+def generate_meme_content(summary, memes_info, num_memes=3, top_k=None):
+    """
+    Identifies major events/achievements and recommends meme templates.
+
+    Args:
+        summary (str): Summary generated by the summary agent.
+        memes_info (list): List of dictionaries containing meme template information.
+        num_memes (int): Number of memes to generate.
+        top_k (int): Describe only this many best-matching templates (default: config.TEMPLATE_TOP_K, 0 for all).
+
+    Returns:
+        list: List of dictionaries with meme IDs and inputs.
+    """
+    response = _get_client().beta.chat.completions.parse(**_completion_request(summary, memes_info, num_memes, top_k))
+    return _parse_memes(response)
+
+
+async def generate_meme_content_async(summary, memes_info, num_memes=3, top_k=None):
+    """Same as `generate_meme_content`, on the event loop's AsyncOpenAI client."""
+    response = await _get_async_client().beta.chat.completions.parse(
+        **_completion_request(summary, memes_info, num_memes, top_k))
+    return _parse_memes(response)
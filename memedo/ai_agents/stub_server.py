@@ -0,0 +1,134 @@
+"""
+Local stand-in for the Perplexity and OpenAI chat completion APIs.
+
+    python -m memedo.ai_agents.stub_server [--port 8787] [--delay 0.5] [--delay-per-1k-tokens 0.05] [--fail-rate 0.2]
+
+then point the agents at it:
+
+    MEMEDO_PERPLEXITY_BASE_URL=http://localhost:8787
+    MEMEDO_OPENAI_BASE_URL=http://localhost:8787/v1
+
+Summaries are canned text. Meme requests get the first `num_memes` template
+ids found in the prompt, each with the first example caption from its
+instruction, so the response parses as a `MemeList` and every meme renders. `--delay`
+simulates LLM latency, `--delay-per-1k-tokens` adds time for prompt
+processing (tokens estimated as chars/4), and `--fail-rate` answers that
+share of requests with a 503 to exercise the retry paths.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from memedo.models.template_registry import template_registry
+
+SUMMARY = ("What a match! The captain dropped a sitter, the crowd lost its mind "
+           "and the bowlers bowled like they had somewhere better to be.")
+
+
+def _meme_list(prompt):
+    ids = [int(template_id) for template_id in re.findall(r"^ID: (\d+)$", prompt, flags=re.MULTILINE)]
+    count = re.search(r"Please choose (\d+) meme templates", prompt)
+    ids = ids[:int(count.group(1))] if count else ids[:3]
+    return {"memes": [
+        {"id": template_id, "meme_creation_input": _example_input(template_id), "reasoning": "stub"}
+        for template_id in ids
+    ]}
+
+
+def _example_input(template_id):
+    if template_id not in template_registry:
+        return "{}"
+    return json.dumps(template_registry.example_inputs(template_id)[0])
+
+
+def _completion(model, content):
+    return {
+        "id": "stub-completion",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class Stub_Handler(BaseHTTPRequestHandler):
+    delay = 0.0
+    delay_per_1k_tokens = 0.0
+    fail_rate = 0.0
+    requests_served = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        type(self).requests_served += 1
+        prompt_chars = sum(len(message.get("content") or "") for message in body.get("messages", []))
+        time.sleep(self.delay + self.delay_per_1k_tokens * prompt_chars / 4000)
+        if random.random() < self.fail_rate:
+            return self._send(503, {"error": {"message": "stub failure"}})
+
+        if self.path.rstrip("/") == "/chat/completions":
+            content = SUMMARY
+        elif self.path.rstrip("/") == "/v1/chat/completions":
+            prompt = body["messages"][-1]["content"]
+            content = json.dumps(_meme_list(prompt))
+        else:
+            return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+        self._send(200, _completion(body.get("model", "stub"), content))
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Stub_Server(ThreadingHTTPServer):
+    # The default backlog of 5 makes concurrent clients wait on connection retries
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def _handler(delay, delay_per_1k_tokens, fail_rate):
+    return type("Configured_Stub_Handler", (Stub_Handler,), {
+        "delay": delay, "delay_per_1k_tokens": delay_per_1k_tokens, "fail_rate": fail_rate,
+    })
+
+
+def start_stub_server(port=0, delay=0.0, fail_rate=0.0, delay_per_1k_tokens=0.0):
+    """Serve the stub on a daemon thread; port 0 picks a free one (see `server.server_port`)."""
+    handler = _handler(delay, delay_per_1k_tokens, fail_rate)
+    server = Stub_Server(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--delay-per-1k-tokens", type=float, default=0.0,
+                        help="extra seconds per thousand prompt tokens")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    args = parser.parse_args()
+
+    handler = _handler(args.delay, args.delay_per_1k_tokens, args.fail_rate)
+    server = Stub_Server(("127.0.0.1", args.port), handler)
+    print(f"Stub LLM server on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
-import requests
+import asyncio
+import weakref
+
+import httpx
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+from memedo import config
+from memedo.utils.summary_cache import Single_Flight, normalize_prompt, summary_cache
+
 PERPLEXITY_KEY = os.getenv("PERPLEXITY_KEY")
 
-url = "https://api.perplexity.ai/chat/completions"
+url = f"{config.PERPLEXITY_BASE_URL.rstrip('/')}/chat/completions"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 # prompt = """
 # You are a passionate, brash commentator who speaks his mind. 
 # You do not care about being politically correct. 
@@ -36,7 +41,7 @@ Summarize what happened in
 # """
 
 
-def get_match_summary(event_desc: str) -> str:
+def _summary_request(event_desc: str):
     payload = {
         "model": "llama-3.1-sonar-large-128k-online",
         "messages": [
@@ -66,6 +71,135 @@ def get_match_summary(event_desc: str) -> str:
         "Authorization": f"Bearer {PERPLEXITY_KEY}",
         "Content-Type": "application/json"
     }
+    return payload, headers
+
+
+def _summary_content(response_json) -> str:
+    return response_json["choices"][0]["message"]["content"]
+
+
+_session = None
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        # Only the sync path uses requests, so it isn't imported at startup
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=config.LLM_MAX_RETRIES, backoff_factor=0.5, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=None, raise_on_status=False)
+        _session = requests.Session()
+        _session.mount("http://", HTTPAdapter(max_retries=retry, pool_maxsize=config.LLM_MAX_CONNECTIONS))
+        _session.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=config.LLM_MAX_CONNECTIONS))
+    return _session
+
+
+def get_match_summary(event_desc: str) -> str:
+    payload, headers = _summary_request(event_desc)
+    response = _get_session().post(url, json=payload, headers=headers, timeout=config.LLM_TIMEOUT)
+    response.raise_for_status()
+    return _summary_content(response.json())
+
+
+# httpx pools are bound to the event loop that opened them, so keep one client per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=config.LLM_TIMEOUT,
+            limits=httpx.Limits(max_connections=config.LLM_MAX_CONNECTIONS),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_client():
+    """Close the current event loop's client; call before the loop shuts down."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def get_match_summary_async(event_desc: str) -> str:
+    """Same as `get_match_summary`, without blocking a thread for the request."""
+    payload, headers = _summary_request(event_desc)
+    client = _get_async_client()
+    for attempt in range(config.LLM_MAX_RETRIES + 1):
+        last_attempt = attempt == config.LLM_MAX_RETRIES
+        try:
+            response = await client.post(url, json=payload, headers=headers)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                response.raise_for_status()
+                return _summary_content(response.json())
+        # Exponential backoff, like the sync session's Retry
+        await asyncio.sleep(0.5 * 2 ** attempt)
+
+
+summary_flight = Single_Flight()
+# In-flight async fetches, per event loop: {loop: {key: task}}
+_async_flights = weakref.WeakKeyDictionary()
+
+
+def _store_summary(key, event_desc, summary):
+    summary_cache.put(key, event_desc, summary)
+    return summary
+
+
+def _fetch_and_store(key, event_desc):
+    # The previous leader may have stored it between our cache miss and us taking the lead
+    summary = summary_cache.get(key, count=False)
+    if summary is not None:
+        return summary
+    return _store_summary(key, event_desc, get_match_summary(event_desc))
+
+
+def get_match_summary_cached(event_desc: str) -> str:
+    """
+    `get_match_summary` behind the summary cache. Prompts that normalize to
+    the same key share one entry, and concurrent misses for a key wait on a
+    single upstream call.
+    """
+    if not config.SUMMARY_CACHE_ENABLED:
+        return get_match_summary(event_desc)
+    key = normalize_prompt(event_desc)
+    summary = summary_cache.get(key)
+    if summary is not None:
+        return summary
+    return summary_flight.do(key, lambda: _fetch_and_store(key, event_desc))
+
+
+async def _fetch_and_store_async(key, event_desc):
+    summary = summary_cache.get(key, count=False)
+    if summary is not None:
+        return summary
+    return _store_summary(key, event_desc, await get_match_summary_async(event_desc))
+
 
-    response = requests.request("POST", url, json=payload, headers=headers)
-    return response.json()["choices"][0]["message"]["content"]
+async def get_match_summary_cached_async(event_desc: str) -> str:
+    """Async `get_match_summary_cached`; misses are coalesced per event loop."""
+    if not config.SUMMARY_CACHE_ENABLED:
+        return await get_match_summary_async(event_desc)
+    key = normalize_prompt(event_desc)
+    summary = summary_cache.get(key)
+    if summary is not None:
+        return summary
+    flights = _async_flights.setdefault(asyncio.get_running_loop(), {})
+    task = flights.get(key)
+    if task is None:
+        task = flights[key] = asyncio.ensure_future(_fetch_and_store_async(key, event_desc))
+        task.add_done_callback(lambda _: flights.pop(key, None))
+    else:
+        summary_flight.coalesced += 1
+    # Shielded so one caller being cancelled doesn't cancel the fetch for the others
+    return await asyncio.shield(task)
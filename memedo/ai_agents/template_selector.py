@@ -0,0 +1,70 @@
+import math
+import re
+from collections import Counter
+
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have he her his i in is it its me my of on or our she so that the
+their them they this to was we were what when who will with you your
+""".split())
+
+
+def tokenize(text):
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower().replace("_", " ")) if token not in STOP_WORDS]
+
+
+class Template_Index:
+    """
+    TF-IDF index over each template's name and description, for picking the
+    templates worth describing in full to the LLM.
+
+    It is plain Python and builds in well under a millisecond per hundred
+    templates, so it is rebuilt whenever the catalogue changes rather than
+    stored anywhere.
+    """
+
+    def __init__(self, memes_info):
+        documents = [Counter(tokenize(f"{meme['name']} {meme['description']}")) for meme in memes_info]
+        document_frequency = Counter(token for document in documents for token in document)
+        count = len(documents)
+        # Smoothed idf, so a word in every template still counts a little
+        self.idf = {token: math.log((1 + count) / (1 + frequency)) + 1
+                    for token, frequency in document_frequency.items()}
+        self.vectors = [self._normalize({token: tf * self.idf[token] for token, tf in document.items()})
+                        for document in documents]
+
+    @staticmethod
+    def _normalize(vector):
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {token: weight / norm for token, weight in vector.items()} if norm else {}
+
+    def scores(self, text):
+        query = self._normalize({token: tf * self.idf[token] for token, tf in Counter(tokenize(text)).items()
+                                 if token in self.idf})
+        return [sum(weight * vector.get(token, 0.0) for token, weight in query.items()) for vector in self.vectors]
+
+    def top_k(self, text, k):
+        """
+        Positions of the `k` best-matching templates, in catalogue order.
+
+        Keeping catalogue order (rather than score order) means the same
+        selection always renders the same prompt. Ties, including templates
+        that don't match at all, go to the ones listed first.
+        """
+        scores = self.scores(text)
+        ranked = sorted(range(len(scores)), key=lambda i: -scores[i])[:k]
+        return sorted(ranked)
+
+
+# Indexes built so far, keyed on the template fields they were built from
+_indexes = {}
+
+
+def select_templates(summary, memes_info, k):
+    """Top `k` templates in `memes_info` for `summary`; all of them if there are no more than `k`."""
+    if k >= len(memes_info):
+        return list(memes_info)
+    key = tuple((meme['id'], meme['name'], meme['description']) for meme in memes_info)
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = Template_Index(memes_info)
+    return [memes_info[i] for i in index.top_k(summary, k)]
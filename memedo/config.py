@@ -1 +1,86 @@
+import os
 
+from dotenv import load_dotenv
+
+# The only place .env is read: everything below, and the API keys the agents read, may come from it
+load_dotenv()
+
+
+def _env_bool(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Decoded template cache (memedo/utils/template_cache.py). Each render worker has its own, so together they may
+# hold up to this many bytes times MEMEDO_RENDER_WORKERS
+TEMPLATE_CACHE_MAX_BYTES = int(os.getenv("MEMEDO_TEMPLATE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+TEMPLATE_CACHE_WARM = _env_bool("MEMEDO_TEMPLATE_CACHE_WARM")
+
+# Font registry (memedo/utils/image_processor.py)
+FONT_PRELOAD = _env_bool("MEMEDO_FONT_PRELOAD", default=True)
+
+# GIF captioning: "numpy" (vectorized over the frame stack), "palette" (no re-quantizing, but no anti-aliasing and
+# 12-20% bigger files on the shipped GIFs), "layer" or "per_frame"
+GIF_CAPTION_MODE = os.getenv("MEMEDO_GIF_CAPTION_MODE", "numpy")
+GIF_FRAME_BUFFER = max(1, int(os.getenv("MEMEDO_GIF_FRAME_BUFFER", 16)))
+
+# Meme rendering pool (memedo/controllers/meme_generator.py)
+RENDER_WORKERS = int(os.getenv("MEMEDO_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+RENDER_TIMEOUT = float(os.getenv("MEMEDO_RENDER_TIMEOUT", 60))
+RENDER_START_METHOD = os.getenv("MEMEDO_RENDER_START_METHOD", "spawn")
+
+# Generation job queue (memedo/controllers/job_queue.py)
+GENERATION_WORKERS = max(1, int(os.getenv("MEMEDO_GENERATION_WORKERS", 2)))
+GENERATION_QUEUE_SIZE = max(1, int(os.getenv("MEMEDO_GENERATION_QUEUE_SIZE", 32)))
+GENERATION_SHUTDOWN_TIMEOUT = float(os.getenv("MEMEDO_GENERATION_SHUTDOWN_TIMEOUT", 30))
+GENERATION_PENDING_PATH = os.getenv("MEMEDO_GENERATION_PENDING_PATH", "data/pending_jobs.jsonl")
+
+# Rendered memes (memedo/utils/output_store.py): identical renders are served from disk, and the output
+# directory is trimmed to this size, least recently used first
+OUTPUT_CACHE_ENABLED = _env_bool("MEMEDO_OUTPUT_CACHE", default=True)
+OUTPUT_STORE_MAX_BYTES = int(os.getenv("MEMEDO_OUTPUT_STORE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+# LLM clients (memedo/ai_agents); point the base URLs at memedo/ai_agents/stub_server.py for local runs
+LLM_TIMEOUT = float(os.getenv("MEMEDO_LLM_TIMEOUT", 60))
+LLM_MAX_RETRIES = max(0, int(os.getenv("MEMEDO_LLM_MAX_RETRIES", 2)))
+LLM_MAX_CONNECTIONS = max(1, int(os.getenv("MEMEDO_LLM_MAX_CONNECTIONS", 20)))
+PERPLEXITY_BASE_URL = os.getenv("MEMEDO_PERPLEXITY_BASE_URL", "https://api.perplexity.ai")
+OPENAI_BASE_URL = os.getenv("MEMEDO_OPENAI_BASE_URL") or None
+
+# Match summary cache (memedo/utils/summary_cache.py)
+SUMMARY_CACHE_ENABLED = _env_bool("MEMEDO_SUMMARY_CACHE", default=True)
+SUMMARY_CACHE_PATH = os.getenv("MEMEDO_SUMMARY_CACHE_PATH", "data/summary_cache.db")
+SUMMARY_CACHE_TTL = float(os.getenv("MEMEDO_SUMMARY_CACHE_TTL", 15 * 60))
+SUMMARY_CACHE_MAX_ENTRIES = max(1, int(os.getenv("MEMEDO_SUMMARY_CACHE_MAX_ENTRIES", 1000)))
+
+# Templates described in full to the meme LLM, picked by TF-IDF match with the summary. 0 (the default) sends the
+# whole catalogue, which is a byte-stable prefix the provider caches; set it once the catalogue is much bigger
+TEMPLATE_TOP_K = max(0, int(os.getenv("MEMEDO_TEMPLATE_TOP_K", 0)))
+
+# Seconds between keepalive comments on an idle client event stream
+SSE_KEEPALIVE_SECONDS = float(os.getenv("MEMEDO_SSE_KEEPALIVE_SECONDS", 15))
+# Seconds a client's watched generations are kept while it has no event stream open (memedo/controllers/events.py)
+EVENT_WATCH_TTL = max(1.0, float(os.getenv("MEMEDO_EVENT_WATCH_TTL", 300)))
+
+# Generations database (memedo/utils/database.py). Writes are batched into one transaction by a single writer;
+# synchronous=NORMAL under WAL can lose the last commits on power loss, never corrupt the file
+GENS_DB_PATH = os.getenv("MEMEDO_GENS_DB_PATH", "data/gens.db")
+DB_BUSY_TIMEOUT_MS = max(0, int(os.getenv("MEMEDO_DB_BUSY_TIMEOUT_MS", 5000)))
+DB_SYNCHRONOUS = os.getenv("MEMEDO_DB_SYNCHRONOUS", "NORMAL").upper()
+DB_WRITE_BATCH_SIZE = max(1, int(os.getenv("MEMEDO_DB_WRITE_BATCH_SIZE", 128)))
+DB_WRITE_BATCH_WAIT = max(0.0, float(os.getenv("MEMEDO_DB_WRITE_BATCH_WAIT", 0)))
+
+# Browser cache lifetime of static files that aren't content-addressed (those are immutable)
+STATIC_MAX_AGE = max(0, int(os.getenv("MEMEDO_STATIC_MAX_AGE", 3600)))
+
+# Home page gallery
+GALLERY_PAGE_SIZE = max(1, int(os.getenv("MEMEDO_GALLERY_PAGE_SIZE", 10)))
+CARD_CACHE_MAX_ENTRIES = max(1, int(os.getenv("MEMEDO_CARD_CACHE_MAX_ENTRIES", 1000)))
+
+# Stage timings of each generation (memedo/utils/tracing.py), served as histograms on /metrics. With an OTLP/HTTP
+# endpoint (e.g. http://localhost:4318/v1/traces) and the OpenTelemetry SDK installed, spans are exported there too
+TRACING_ENABLED = _env_bool("MEMEDO_TRACING", default=True)
+OTEL_ENDPOINT = os.getenv("MEMEDO_OTEL_ENDPOINT") or None
+OTEL_SERVICE_NAME = os.getenv("MEMEDO_OTEL_SERVICE_NAME", "memedo")
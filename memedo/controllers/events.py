@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+from memedo import config
+
+
+class Event_Hub:
+    """
+    Route "generation changed" notifications from worker threads to clients.
+
+    Each client (a browser session) holds one SSE stream and watches any
+    number of generations over it. `publish` may be called from any thread:
+    it wakes every stream of every client watching that generation, on the
+    stream's own event loop. Streams get generation ids from their queue and
+    render what changed themselves.
+
+    Streams unwatch a generation once they have sent it finished, but a
+    client may never open one (JavaScript off, a crawler, a tab closed first).
+    So a client's watches are dropped once it has had no open stream for
+    `idle_watch_ttl` seconds since its last watch or stream.
+    """
+
+    def __init__(self, idle_watch_ttl=300):
+        self.idle_watch_ttl = idle_watch_ttl
+        self._watchers = {}  # generation id -> set of client ids
+        self._watching = {}  # client id -> set of generation ids
+        self._streams = {}  # client id -> set of (loop, queue)
+        self._idle_since = {}  # client id -> monotonic time, for clients without a stream
+        self._last_expiry = 0.0
+        self._lock = threading.Lock()
+        self.published = 0
+        self.expired_watches = 0
+
+    def watch(self, client_id, key):
+        now = time.monotonic()
+        with self._lock:
+            self._watchers.setdefault(key, set()).add(client_id)
+            self._watching.setdefault(client_id, set()).add(key)
+            if client_id not in self._streams:
+                self._idle_since[client_id] = now
+            self._expire_idle(now)
+        # Wake the client's stream so it sends the new generation's state
+        self._notify([client_id], key)
+
+    def unwatch(self, client_id, key):
+        with self._lock:
+            self._discard(self._watchers, key, client_id)
+            self._discard(self._watching, client_id, key)
+
+    def _expire_idle(self, now):
+        # Called with the lock held; a full pass at most once a second
+        if now - self._last_expiry < 1:
+            return
+        self._last_expiry = now
+        for client_id, since in list(self._idle_since.items()):
+            if now - since < self.idle_watch_ttl:
+                continue
+            del self._idle_since[client_id]
+            for key in self._watching.pop(client_id, ()):
+                self._discard(self._watchers, key, client_id)
+                self.expired_watches += 1
+
+    @staticmethod
+    def _discard(mapping, key, value):
+        values = mapping.get(key)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del mapping[key]
+
+    def watched(self, client_id):
+        with self._lock:
+            return set(self._watching.get(client_id, ()))
+
+    @contextmanager
+    def subscribe(self, client_id):
+        stream = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._streams.setdefault(client_id, set()).add(stream)
+            self._idle_since.pop(client_id, None)
+        try:
+            yield stream[1]
+        finally:
+            with self._lock:
+                self._discard(self._streams, client_id, stream)
+                if client_id not in self._streams:
+                    self._idle_since[client_id] = time.monotonic()
+
+    def publish(self, key):
+        with self._lock:
+            clients = list(self._watchers.get(key, ()))
+            self.published += 1
+        self._notify(clients, key)
+
+    def _notify(self, clients, key):
+        with self._lock:
+            streams = [stream for client_id in clients for stream in self._streams.get(client_id, ())]
+        for loop, queue in streams:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, key)
+            except RuntimeError:
+                # The stream's loop has closed; the stream is gone
+                pass
+
+    def stats(self):
+        with self._lock:
+            self._expire_idle(time.monotonic())
+            return {
+                "clients": len(self._watching.keys() | self._streams.keys()),
+                "streams": sum(len(streams) for streams in self._streams.values()),
+                "watched_generations": len(self._watchers),
+                "idle_clients": len(self._idle_since),
+                "expired_watches": self.expired_watches,
+                "published": self.published,
+            }
+
+
+generation_events = Event_Hub(config.EVENT_WATCH_TTL)
@@ -0,0 +1,169 @@
+import json
+import os
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+
+from loguru import logger
+
+
+class Queue_Full(Exception):
+    pass
+
+
+class Job_Queue:
+    """
+    Run jobs on a fixed number of worker threads.
+
+    At most `max_pending` jobs wait at a time; `submit` raises `Queue_Full`
+    beyond that so callers can push back instead of piling up threads. On
+    shutdown, workers finish what they're running (up to a timeout) and jobs
+    that never ran are written to `persist_path`, to be queued again by the
+    next `start`. Jobs still running at the timeout are written too and run
+    again from scratch, so the handler must be safe to re-run for a job id.
+    """
+
+    def __init__(self, handler, workers=2, max_pending=32, persist_path=None, name="jobs"):
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.persist_path = persist_path
+        self.name = name
+        self._pending = OrderedDict()  # job_id -> (args, enqueued_at)
+        self._running = {}  # job_id -> args
+        self._condition = threading.Condition()
+        self._threads = []
+        self._accepting = False
+        self._wait_times = deque(maxlen=500)
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def start(self):
+        with self._condition:
+            if self._threads:
+                return
+            self._accepting = True
+            for job_id, args in self._load_persisted():
+                self._pending[job_id] = (args, time.monotonic())
+            self._threads = [
+                threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Started {self.workers} {self.name} workers with {len(self._pending)} jobs queued")
+
+    def submit(self, job_id, *args):
+        """Queue a job and return its position (1 = next to run)."""
+        with self._condition:
+            if not self._accepting:
+                raise Queue_Full(f"{self.name} queue is shutting down")
+            if len(self._pending) >= self.max_pending:
+                self._rejected += 1
+                raise Queue_Full(f"{self.name} queue is full ({self.max_pending} jobs waiting)")
+            self._pending[job_id] = (args, time.monotonic())
+            self._condition.notify()
+            return len(self._pending)
+
+    def position(self, job_id):
+        """1-based position of a waiting job, 0 if it is running, None if unknown."""
+        with self._condition:
+            if job_id in self._running:
+                return 0
+            for position, pending_id in enumerate(self._pending, start=1):
+                if pending_id == job_id:
+                    return position
+            return None
+
+    def queued(self):
+        """Ids of the waiting jobs, next to run first."""
+        with self._condition:
+            return list(self._pending)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while self._accepting and not self._pending:
+                    self._condition.wait()
+                if not self._accepting:
+                    return
+                job_id, (args, enqueued_at) = self._pending.popitem(last=False)
+                self._running[job_id] = args
+                waited = time.monotonic() - enqueued_at
+                self._wait_times.append(waited)
+                depth = len(self._pending)
+            logger.info(f"{self.name} job {job_id} started after waiting {waited:.1f}s ({depth} still queued)")
+            try:
+                self.handler(job_id, *args)
+                succeeded = True
+            except Exception:
+                logger.exception(f"{self.name} job {job_id} failed")
+                succeeded = False
+            with self._condition:
+                self._running.pop(job_id, None)
+                if succeeded:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+                self._condition.notify_all()
+
+    def shutdown(self, timeout=30):
+        """
+        Stop taking jobs, let running ones finish, and persist the rest.
+        Returns True once every worker thread has exited, False if some were
+        still running a job at the timeout.
+        """
+        with self._condition:
+            self._accepting = False
+            self._condition.notify_all()
+            threads, self._threads = self._threads, []
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        with self._condition:
+            # Jobs still running past the deadline are persisted too; they restart from scratch
+            leftover = [(job_id, args) for job_id, args in self._running.items()]
+            leftover += [(job_id, args) for job_id, (args, _) in self._pending.items()]
+            self._pending.clear()
+        self._persist(leftover)
+        stopped = not any(thread.is_alive() for thread in threads)
+        logger.info(f"Stopped {self.name} workers, {len(leftover)} jobs left for the next start")
+        return stopped
+
+    def _persist(self, jobs):
+        if not self.persist_path or not jobs:
+            return
+        os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+        with open(self.persist_path, "a") as f:
+            for job_id, args in jobs:
+                f.write(json.dumps({"id": job_id, "args": list(args)}) + "\n")
+
+    def _load_persisted(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return []
+        with open(self.persist_path) as f:
+            jobs = [json.loads(line) for line in f if line.strip()]
+        os.remove(self.persist_path)
+        return [(job["id"], tuple(job["args"])) for job in jobs]
+
+    def stats(self):
+        with self._condition:
+            wait_times = sorted(self._wait_times)
+            stats = {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "queued": len(self._pending),
+                "running": len(self._running),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+        if wait_times:
+            stats["wait_seconds"] = {
+                "p50": statistics.median(wait_times),
+                "p95": wait_times[min(len(wait_times) - 1, int(len(wait_times) * 0.95))],
+                "max": wait_times[-1],
+            }
+        return stats
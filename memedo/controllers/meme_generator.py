@@ -0,0 +1,245 @@
+import functools
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+from loguru import logger
+
+from memedo import config
+from memedo.models.meme_template import BaseGIFTemplate, preload_fonts, warm_template_cache
+from memedo.models.template_registry import template_registry
+from memedo.utils.output_store import output_store
+from memedo.utils.template_cache import template_cache
+from memedo.utils.tracing import tracer
+
+_pool = None
+_pool_lock = threading.Lock()
+# Worker pid -> that worker's template cache stats, as of its last render (the cache lives in the workers)
+_worker_cache_stats = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _class_source_hash(meme_class):
+    # Caption positions and sizes live in the template's code, so a layout change must change the key
+    try:
+        source = inspect.getsource(meme_class)
+    except (OSError, TypeError):
+        source = meme_class.__qualname__
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def render_key(template_id, meme_creation_input):
+    """
+    Content-addressed output file name for a meme: a hash of the template (id,
+    image file and code), the font, the captions and the caption mode. Memes
+    that would render to the same bytes get the same name.
+    """
+    meme_class = template_registry.get(template_id)
+    template = template_registry.instance(template_id)
+    if isinstance(template, BaseGIFTemplate):
+        source, extension, params = template.get_template_gif_path(), "gif", {"caption_mode": template.caption_mode}
+    else:
+        source, extension, params = template.get_template_path(), "jpg", {}
+    digest = output_store.key(template_id, output_store.file_hash(source), _class_source_hash(meme_class),
+                              output_store.file_hash(template.font_path), json.loads(meme_creation_input), params)
+    return f"{digest}.{extension}"
+
+
+def output_stats(template_id, path, render_ms, encode_ms=0.0):
+    with Image.open(path) as image:
+        width, height = image.size
+    return {
+        "template_id": template_id,
+        "file_name": os.path.basename(path),
+        "width": width,
+        "height": height,
+        "bytes": os.path.getsize(path),
+        "render_ms": render_ms,
+        "encode_ms": encode_ms,
+        "status": "ok",
+    }
+
+
+def render_meme_with_stats(template_id, meme_creation_input, output_name=None):
+    """
+    Render one meme (runs in a worker process) and describe the output: file
+    name, size in pixels and bytes, and how long the render took, of which
+    how long went to encoding and writing the file. "worker" carries the
+    worker's template cache stats back to the app (see template_cache_stats).
+    """
+    template = template_registry.get(template_id)()
+    template.output_name = output_name
+    start = time.perf_counter()
+    file_name = template.create(json.loads(meme_creation_input))
+    render_ms = (time.perf_counter() - start) * 1000
+    output_dir = template.template_output_gif_dir if isinstance(template, BaseGIFTemplate) else template.output_image_dir
+    stats = output_stats(template_id, os.path.join(output_dir, file_name), render_ms, template.encode_seconds * 1000)
+    stats["worker"] = _worker_stats()
+    return stats
+
+
+def _worker_stats():
+    return {"pid": os.getpid(), "template_cache": template_cache.stats()}
+
+
+def _record_worker_stats(worker):
+    if worker is not None:
+        _worker_cache_stats[worker["pid"]] = worker["template_cache"]
+
+
+def template_cache_stats():
+    """
+    Template cache stats of each render worker, as of its last render or the
+    pool warm-up, and their totals. The byte budget is per worker, so the
+    caches together may hold up to max_bytes times the number of workers.
+    """
+    workers = dict(_worker_cache_stats)
+    totals = {key: sum(stats[key] for stats in workers.values())
+              for key in ("entries", "bytes", "hits", "misses", "evictions")}
+    return {
+        "workers": {str(pid): stats for pid, stats in workers.items()},
+        "total": totals,
+        "max_bytes_per_worker": config.TEMPLATE_CACHE_MAX_BYTES,
+    }
+
+
+def _stored_render(meme):
+    """
+    The content-addressed file name for a meme and its stats if it is already
+    stored: (file name, stats or None). The file name is None when caching is
+    off or the input can't be keyed; the render then picks its own name.
+    """
+    if not config.OUTPUT_CACHE_ENABLED:
+        return None, None
+    try:
+        file_name = render_key(meme["id"], meme["meme_creation_input"])
+    except Exception as e:
+        logger.warning(f"Can't key meme {meme['id']} for the output cache, rendering it: {e!r}")
+        return None, None
+    if not output_store.lookup(file_name):
+        return file_name, None
+    try:
+        return file_name, output_stats(meme["id"], os.path.join(output_store.directory, file_name), 0.0)
+    except OSError:
+        # Evicted between the lookup and now
+        return file_name, None
+
+
+def _output_name(file_name):
+    return os.path.splitext(file_name)[0] if file_name else None
+
+
+def _init_worker():
+    if config.FONT_PRELOAD:
+        preload_fonts(template_registry)
+    if config.TEMPLATE_CACHE_WARM:
+        warm_template_cache(template_registry)
+
+
+def get_render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # PIL drawing and GIF encoding hold the GIL, so renders go to processes.
+            # "spawn" avoids forking a process that already runs request threads.
+            _pool = ProcessPoolExecutor(
+                max_workers=config.RENDER_WORKERS,
+                mp_context=multiprocessing.get_context(config.RENDER_START_METHOD),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def warm_render_pool():
+    """Start every render worker now (each runs its initializer) rather than on the first renders."""
+    pool = get_render_pool()
+    for future in [pool.submit(_worker_stats) for _ in range(config.RENDER_WORKERS)]:
+        _record_worker_stats(future.result())
+
+
+def shutdown_render_pool(wait=True):
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def _reset_broken_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            _worker_cache_stats.clear()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_memes_as_completed(generated_memes, timeout=None):
+    """
+    Render memes on the process pool and yield a `render_meme_with_stats`
+    result for each one as soon as it finishes, fastest first.
+
+    Memes that fail are yielded with status "failed", and once `timeout`
+    seconds have passed since submission the unfinished ones are yielded with
+    status "timeout", so every meme gets exactly one result. Memes already in
+    the output store come first, with a render_ms of 0.
+
+    Each meme's render and encode time is recorded as a tracing span, with
+    the template id; a failed or timed out meme counts from submission.
+    """
+    timeout = config.RENDER_TIMEOUT if timeout is None else timeout
+    pool = get_render_pool()
+    submitted_at = time.monotonic()
+    futures, stored = {}, []
+    for meme in generated_memes:
+        if meme["id"] not in template_registry:
+            logger.error(f"The LLM picked unknown template {meme['id']!r}")
+            # Not the raw id: whatever the LLM makes up would become a new histogram series
+            tracer.record("render", 0.0, status="failed", template="unknown")
+            stored.append({"template_id": meme["id"], "status": "failed"})
+            continue
+        file_name, stats = _stored_render(meme)
+        if stats:
+            tracer.record("render", 0.0, status="cached", template=meme["id"])
+            stored.append(stats)
+        else:
+            future = pool.submit(render_meme_with_stats, meme["id"], meme["meme_creation_input"], _output_name(file_name))
+            futures[future] = meme
+    pending = set(futures)
+    try:
+        yield from stored
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            meme = futures[future]
+            try:
+                result = future.result()
+                _record_worker_stats(result.pop("worker", None))
+                tracer.record("render", result["render_ms"] / 1000, template=meme["id"])
+                tracer.record("encode", result["encode_ms"] / 1000, template=meme["id"])
+                output_store.add(result["file_name"])
+                yield result
+            except BrokenProcessPool:
+                logger.exception(f"Render pool died while rendering meme {meme['id']}")
+                _reset_broken_pool(pool)
+                tracer.record("render", time.monotonic() - submitted_at, status="failed", template=meme["id"])
+                yield {"template_id": meme["id"], "status": "failed"}
+            except Exception:
+                logger.exception(f"Rendering meme {meme['id']} failed")
+                tracer.record("render", time.monotonic() - submitted_at, status="failed", template=meme["id"])
+                yield {"template_id": meme["id"], "status": "failed"}
+    except TimeoutError:
+        logger.error(f"Rendering memes {[futures[future]['id'] for future in pending]} timed out after {timeout}s")
+        for future in pending:
+            tracer.record("render", timeout, status="timeout", template=futures[future]["id"])
+            yield {"template_id": futures[future]["id"], "status": "timeout"}
+    finally:
+        # Also reached when the caller stops iterating early
+        for future in futures:
+            future.cancel()
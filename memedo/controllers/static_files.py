@@ -0,0 +1,207 @@
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import Counter
+
+from starlette.responses import FileResponse, Response
+
+from memedo import config
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_CONTENT_ADDRESSED = re.compile(r"[0-9a-f]{64}\.[a-z0-9]+")
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".html", ".txt", ".map"}
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class Static_Stats:
+    """Responses by status code and body bytes sent, overall and by cache policy."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statuses = Counter()
+        self._bytes = Counter()
+        self._encodings = Counter()
+
+    def record(self, status, sent, policy, encoding=None):
+        with self._lock:
+            self._statuses[status] += 1
+            self._bytes[policy] += sent
+            if encoding:
+                self._encodings[encoding] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": sum(self._statuses.values()),
+                "by_status": {str(status): count for status, count in sorted(self._statuses.items())},
+                "bytes": sum(self._bytes.values()),
+                "bytes_by_policy": dict(self._bytes),
+                "precompressed": dict(self._encodings),
+            }
+
+
+static_stats = Static_Stats()
+
+
+class Counted_File_Response(FileResponse):
+    """A FileResponse that reports its final status and body size to `static_stats`."""
+
+    def __init__(self, *args, policy, encoding=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.policy = policy
+        self.encoding = encoding
+
+    async def __call__(self, scope, receive, send):
+        status, sent = self.status_code, 0
+
+        async def counting_send(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await super().__call__(scope, receive, counting_send)
+        finally:
+            static_stats.record(status, sent, self.policy, self.encoding)
+
+
+def cache_policy(path):
+    if _CONTENT_ADDRESSED.fullmatch(os.path.basename(path)):
+        return "immutable"
+    return "revalidate"
+
+
+def cache_control(policy):
+    if policy == "immutable":
+        return IMMUTABLE_CACHE_CONTROL
+    return f"public, max-age={config.STATIC_MAX_AGE}"
+
+
+def etag(stat_result, encoding=None):
+    # Same tag starlette derives from mtime and size, plus the encoding so variants don't collide
+    tag = hashlib.md5(f"{stat_result.st_mtime}-{stat_result.st_size}".encode(), usedforsecurity=False).hexdigest()
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+
+def accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def none_match(if_none_match, tag):
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # If-None-Match compares weakly
+    return "*" in tags or tag in tags or f"W/{tag}" in tags
+
+
+def _precompressed(path, stat_result, accept_encoding):
+    if os.path.splitext(path)[1] not in COMPRESSIBLE_EXTENSIONS:
+        return None
+    accepted = accepted_encodings(accept_encoding)
+    for encoding, suffix in ENCODINGS:
+        if encoding not in accepted:
+            continue
+        try:
+            variant_stat = os.stat(path + suffix)
+        except OSError:
+            continue
+        if variant_stat.st_mtime >= stat_result.st_mtime:
+            return encoding, path + suffix, variant_stat
+    return None
+
+
+def static_file_response(path, request_headers, root="."):
+    """
+    Serve `path` (relative to `root`) with cache headers.
+
+    Content-addressed renders (memedo/utils/output_store.py) never change
+    under their name, so they are immutable for a year; everything else gets
+    MEMEDO_STATIC_MAX_AGE. A matching If-None-Match gets a 304. CSS/JS come
+    from a `.br` or `.gz` sibling when the client accepts it and it is at
+    least as new as the file. Ranges are left to starlette's FileResponse.
+    """
+    root = os.path.realpath(root)
+    full_path = os.path.realpath(os.path.join(root, path))
+    policy = cache_policy(full_path)
+    if os.path.commonpath([root, full_path]) != root or not os.path.isfile(full_path):
+        static_stats.record(404, 0, policy)
+        return Response(status_code=404)
+
+    stat_result = os.stat(full_path)
+    headers = {"cache-control": cache_control(policy)}
+    encoding, serve_path, serve_stat = None, full_path, stat_result
+    if os.path.splitext(full_path)[1] in COMPRESSIBLE_EXTENSIONS:
+        headers["vary"] = "Accept-Encoding"
+        variant = _precompressed(full_path, stat_result, request_headers.get("accept-encoding"))
+        if variant:
+            encoding, serve_path, serve_stat = variant
+            headers["content-encoding"] = encoding
+    headers["etag"] = etag(serve_stat, encoding)
+
+    if none_match(request_headers.get("if-none-match"), headers["etag"]):
+        headers.pop("content-encoding", None)
+        static_stats.record(304, 0, policy)
+        return Response(status_code=304, headers=headers)
+    # The media type comes from the original name, not the .gz/.br one
+    return Counted_File_Response(serve_path, headers=headers, stat_result=serve_stat, policy=policy,
+                                 encoding=encoding, media_type=mimetypes.guess_type(full_path)[0] or "text/plain")
+
+
+def precompress(path):
+    """
+    Write .gz (and .br, if the brotli package is installed) next to `path`
+    for `static_file_response` to serve. Returns the files written.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    written = []
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    written.append(path + ".gz")
+    try:
+        import brotli
+    except ImportError:
+        return written
+    with open(path + ".br", "wb") as f:
+        f.write(brotli.compress(data, quality=11))
+    written.append(path + ".br")
+    return written
+
+
+def main():
+    # python -m memedo.controllers.static_files [paths...]
+    parser = argparse.ArgumentParser(description="Precompress static CSS/JS next to the originals.")
+    parser.add_argument("paths", nargs="*", default=["app.css", "memedo/static"])
+    args = parser.parse_args()
+    for root in args.paths:
+        files = [root] if os.path.isfile(root) else [
+            os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names]
+        for path in files:
+            if os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+                for written in precompress(path):
+                    print(f"{written} ({os.path.getsize(written)} of {os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,73 @@
 import datetime
 import textwrap
-
-from PIL import Image
-from memedo.utils.image_processor import Image_Manager
+import threading
+import time
+import uuid
+
+from PIL import GifImagePlugin, Image, ImageSequence
+from memedo.utils.gif_writer import Streaming_Gif_Writer, read_gif_frame_info
+from memedo.utils.image_processor import Image_Manager, Text_Box, font_registry, font_path
+from memedo.utils.template_cache import template_cache
 import os
-from PIL import ImageDraw, ImageFont
-import imageio
+from PIL import ImageColor, ImageDraw
+import numpy as np
+
+from memedo import config
+
+def unique_output_name():
+    # The timestamp keeps outputs in creation order; the suffix keeps same-microsecond renders apart
+    return f"{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:8]}"
 
 
 class BaseMemeTemplate:
     id = None
     name = None
     description = None
+    font_path = font_path
+    # Caption layout: one Text_Box per `meme_creation_input` field
+    captions = ()
 
     template_image_dir = "memedo/static/images/meme_templates"
     output_image_dir = "memedo/out/creations"
+    # Output file name without extension; set it to store the render under a content key
+    output_name = None
+    # Seconds the last `create` spent encoding and writing the output file
+    encode_seconds = 0.0
 
     def __init__(self):
         self.instruction = ""
         self.extension = ""
 
     def create(self, meme_text):
-        raise NotImplementedError("Subclasses must implement the create method.")
+        if not self.captions:
+            raise NotImplementedError("Subclasses must declare captions or implement the create method.")
+        base = self.get_template_image()
+        base = Image_Manager.add_captions(base, [(box, meme_text[box.field]) for box in self.captions])
+        return self.save_output_image(base)
+
+    def get_template_path(self):
+        return f"{self.template_image_dir}/{self.name.lower()}.{self.extension}"
 
     def get_template_image(self):
-        template_path = f"{self.template_image_dir}/{self.name.lower()}.{self.extension}"
-        return Image.open(template_path).convert("RGBA")
+        return template_cache.get(self.get_template_path())
 
     def save_output_image(self, image):
         if image.mode in ("RGBA", "P"):
             image = image.convert("RGB")
-        date_str = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
-        image_name = f"{date_str}.jpg"
+        image_name = f"{self.output_name or unique_output_name()}.jpg"
         file_location = f"{self.output_image_dir}/{image_name}"
-        image.save(file_location)
+        os.makedirs(self.output_image_dir, exist_ok=True)
+        # Write aside and rename, so a concurrent render of the same key never exposes a partial file
+        partial_location = f"{file_location}.{os.getpid()}.{threading.get_ident()}.part"
+        started = time.perf_counter()
+        image.save(partial_location, format="JPEG")
+        os.replace(partial_location, file_location)
+        self.encode_seconds = time.perf_counter() - started
         return image_name
 
-    def add_watermark(self, base_image, text="memedo.ai", position=(10, 10), font_size=20, text_color="white"):
+    watermark_font_size = 20
+
+    def add_watermark(self, base_image, text="memedo.ai", position=(10, 10), font_size=watermark_font_size, text_color="white"):
         watermark = Image_Manager.add_text(
             base=base_image,
             text=text,
@@ -47,51 +78,220 @@ class BaseMemeTemplate:
         return Image.alpha_composite(base_image, watermark)
 
 
+class Caption_Layer:
+    def __init__(self, mask, fill, box):
+        self.mask = mask
+        self.fill = fill
+        self.box = box
+
+
+def _as_rgba(frame):
+    if frame.ndim == 2:
+        frame = np.stack([frame] * 3, axis=-1)
+    if frame.shape[2] == 4:
+        return frame
+    alpha = np.full(frame.shape[:2] + (1,), 255, dtype=frame.dtype)
+    return np.concatenate([frame, alpha], axis=-1)
+
+
+def _palette_index(palette, color):
+    """
+    Find the palette entry to draw `color` with: an exact match, else a new
+    entry if the palette has room, else the closest existing colour.
+    Returns the index and the (possibly extended) palette.
+    """
+    color = tuple(color[:3])
+    entries = [tuple(palette[i:i + 3]) for i in range(0, len(palette), 3)]
+    if color in entries:
+        return entries.index(color), palette
+    if len(entries) < 256:
+        return len(entries), palette + list(color)
+    distances = [sum((a - b) ** 2 for a, b in zip(entry, color)) for entry in entries]
+    return distances.index(min(distances)), palette
+
+
+def _chunked(frames, size):
+    chunk = []
+    for frame in frames:
+        chunk.append(frame)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 class BaseGIFTemplate:
     id = None
     name = None
     description = None
+    # Font sizes used by `create`, preloaded into the font registry at startup
+    font_sizes = ()
+    # The `meme_creation_input` fields `create` reads
+    caption_fields = ()
 
     template_gif_dir = "memedo/static/images/meme_templates"
     template_output_gif_dir = "memedo/out/creations"
+    # Output file name without extension; set it to store the render under a content key
+    output_name = None
+    # Seconds the last `create` spent quantizing and encoding frames
+    encode_seconds = 0.0
     font_path = "memedo/static/fonts/Arial.ttf"
+    caption_mode = config.GIF_CAPTION_MODE
+    # Number of frames held in memory between reading and encoding
+    frame_buffer = config.GIF_FRAME_BUFFER
 
     def __init__(self, ):
         self.font_path = self.font_path
         self.extension = ""
         self.instruction = ""
 
-    def get_template_gif(self):
-        gif_path = f"{self.template_gif_dir}/{self.name.lower()}.{self.extension}"
-        return imageio.get_reader(gif_path)
+    def get_template_gif_path(self):
+        return f"{self.template_gif_dir}/{self.name.lower()}.{self.extension}"
 
-    def add_text_to_frame(self, frame, text, position=(600, 10), font_size=25, text_color="black"):
-        # Convert frame to RGBA
-        frame = frame.convert("RGBA")
+    def get_template_gif(self):
+        # Only the non-palette caption modes read frames through imageio
+        import imageio
+        return imageio.get_reader(self.get_template_gif_path())
 
-        # Create a drawing context
-        draw = ImageDraw.Draw(frame)
+    def render_caption_layer(self, size, text, position=(600, 10), font_size=25, text_color="black"):
+        """
+        Lay out and rasterize a caption once for a GIF of the given frame size.
 
-        # Load the font
-        font = ImageFont.truetype(self.font_path, font_size)
+        The result is an alpha mask cropped to the text, its fill colour and the
+        box it covers, so it can be composited onto every frame without
+        re-wrapping or re-drawing the glyphs.
+        """
+        font = font_registry.get(self.font_path, font_size)
 
         # Define the maximum width for the text
-        max_width = frame.size[0] - position[0] - 10  # Subtracting 10 for padding
-
-        # Wrap the text
+        max_width = size[0] - position[0] - 10  # Subtracting 10 for padding
         lines = self.wrap_text(text, font, max_width)
 
-        # Draw each line of text
+        mask = Image.new("L", size, 0)
+        draw = ImageDraw.Draw(mask)
         y_offset = 0
         # Calculate line height
         bbox = font.getbbox('Ay')
         line_height = bbox[3] - bbox[1] + 5  # Adding 5 for line spacing
         for line in lines:
-            draw.text((position[0], position[1] + y_offset), line, fill=text_color, font=font)
+            draw.text((position[0], position[1] + y_offset), line, fill=255, font=font)
             y_offset += line_height
 
+        box = mask.getbbox()
+        if box is None:
+            return None
+        return Caption_Layer(mask.crop(box), ImageColor.getrgb(text_color), box)
+
+    def apply_caption_layer(self, frame, layer):
+        frame = frame.convert("RGBA")
+        if layer is not None:
+            frame.paste(layer.fill, layer.box, layer.mask)
         return frame
 
+    def apply_caption_layer_to_stack(self, frames, layer):
+        """
+        Composite a caption layer onto a (frames, height, width, channels) uint8
+        array in one vectorized pass. Only the caption's box is touched.
+        """
+        if layer is None:
+            return frames
+        x0, y0, x1, y1 = layer.box
+        alpha = np.asarray(layer.mask, dtype=np.float32)[None, :, :, None] / 255.0
+        fill = np.asarray(layer.fill[:3], dtype=np.float32)
+        region = frames[:, y0:y1, x0:x1, :3].astype(np.float32)
+        frames[:, y0:y1, x0:x1, :3] = (region * (1.0 - alpha) + fill * alpha + 0.5).astype(np.uint8)
+        return frames
+
+    def add_text_to_frame(self, frame, text, position=(600, 10), font_size=25, text_color="black"):
+        layer = self.render_caption_layer(frame.size, text, position, font_size, text_color)
+        return self.apply_caption_layer(frame, layer)
+
+    def caption_chunk(self, chunk, layer, text, position, font_size, text_color):
+        if self.caption_mode == "numpy":
+            stack = self.apply_caption_layer_to_stack(np.stack([_as_rgba(frame) for frame in chunk]), layer)
+            return [Image.fromarray(frame) for frame in stack]
+        if self.caption_mode == "per_frame":
+            return [self.add_text_to_frame(Image.fromarray(frame), text, position, font_size, text_color)
+                    for frame in chunk]
+        return [self.apply_caption_layer(Image.fromarray(frame), layer) for frame in chunk]
+
+    def create_captioned_gif(self, text, position, font_size, text_color="black"):
+        """
+        Caption every frame of the template GIF and stream it to disk.
+
+        Frames are read, captioned, quantized and encoded `frame_buffer` at a
+        time, so memory does not grow with the length of the GIF. The source
+        frame durations and disposal methods are carried over.
+
+        `caption_mode` picks how captions are applied: "palette" draws into the
+        source palette (see `create_paletted_gif`), "numpy" composites the
+        caption onto each buffered frame stack at once, "layer" pastes the
+        pre-rendered caption frame by frame, and "per_frame" lays out and draws
+        the text on each frame.
+        """
+        if self.caption_mode == "palette":
+            return self.create_paletted_gif(text, position, font_size, text_color)
+        reader = self.get_template_gif()
+        timings = read_gif_frame_info(self.get_template_gif_path())
+        gif_name, output_gif_path = self.new_output_gif()
+        layer = None
+        with Streaming_Gif_Writer(output_gif_path, loop=reader.get_meta_data().get("loop", 0)) as writer:
+            for chunk in _chunked(reader, self.frame_buffer):
+                if writer.frame_count == 0:
+                    height, width = chunk[0].shape[:2]
+                    layer = self.render_caption_layer((width, height), text, position, font_size, text_color)
+                for frame in self.caption_chunk(chunk, layer, text, position, font_size, text_color):
+                    duration, disposal = timings[min(writer.frame_count, len(timings) - 1)] if timings else (0, 0)
+                    writer.write_frame(frame, duration, disposal)
+        reader.close()
+        self.encode_seconds = writer.encode_seconds
+        return gif_name
+
+    def create_paletted_gif(self, text, position, font_size, text_color="black"):
+        """
+        Caption the template GIF without leaving its palette.
+
+        Frames that use the source's global palette are captioned in P mode with
+        a single palette entry for the caption colour, and are written out
+        without being re-quantized. The caption is not anti-aliased in this
+        mode. Frames with their own local palette fall back to the RGBA path.
+        """
+        template_path = self.get_template_gif_path()
+        timings = read_gif_frame_info(template_path)
+        gif_name, output_gif_path = self.new_output_gif()
+        # Keep frames in P mode while they share the first frame's palette. The strategy is process-wide
+        # and read as frames load, so it is only changed for this read
+        loading_strategy = GifImagePlugin.LOADING_STRATEGY
+        GifImagePlugin.LOADING_STRATEGY = GifImagePlugin.LoadingStrategy.RGB_AFTER_DIFFERENT_PALETTE_ONLY
+        try:
+            self._write_paletted_gif(template_path, output_gif_path, timings, text, position, font_size, text_color)
+        finally:
+            GifImagePlugin.LOADING_STRATEGY = loading_strategy
+        return gif_name
+
+    def _write_paletted_gif(self, template_path, output_gif_path, timings, text, position, font_size, text_color):
+        with Image.open(template_path) as source:
+            source_palette = source.getpalette()
+            layer = self.render_caption_layer(source.size, text, position, font_size, text_color)
+            index, palette = None, source_palette
+            if layer is not None and source_palette is not None:
+                index, palette = _palette_index(source_palette, layer.fill)
+                hard_mask = layer.mask.point(lambda v: 255 if v >= 128 else 0)
+
+            with Streaming_Gif_Writer(output_gif_path, loop=source.info.get("loop", 0), palette=palette) as writer:
+                for frame in ImageSequence.Iterator(source):
+                    frame = frame.copy()
+                    if index is not None and frame.mode == "P" and frame.getpalette() == source_palette:
+                        if palette != source_palette:
+                            frame.putpalette(palette)
+                        frame.paste(index, layer.box, hard_mask)
+                    else:
+                        frame = self.apply_caption_layer(frame, layer)
+                    duration, disposal = timings[min(writer.frame_count, len(timings) - 1)] if timings else (0, 0)
+                    writer.write_frame(frame, duration, disposal)
+        self.encode_seconds = writer.encode_seconds
+
     def wrap_text(self, text, font, max_width):
         lines = []
         # Use textwrap to split the text into chunks
@@ -117,13 +317,21 @@ class BaseGIFTemplate:
             adjusted_lines.append(current_line.rstrip())
         return adjusted_lines
 
-    def save_output_gif(self, frames):
+    def new_output_gif(self):
         os.makedirs(f"{self.template_output_gif_dir}", exist_ok=True)
-        date_str = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
-        gif_name = f"{date_str}.gif"
-        output_gif_path = f"{self.template_output_gif_dir}/{gif_name}"
-        frames[0].save(output_gif_path, save_all=True, append_images=frames[1:], loop=0)
-        # imageio.mimsave(output_gif_path, frames)
+        gif_name = f"{self.output_name or unique_output_name()}.gif"
+        return gif_name, f"{self.template_output_gif_dir}/{gif_name}"
+
+    def save_output_gif(self, frames, durations=None, disposals=None):
+        gif_name, output_gif_path = self.new_output_gif()
+        with Streaming_Gif_Writer(output_gif_path, loop=0) as writer:
+            for i, frame in enumerate(frames):
+                writer.write_frame(
+                    frame,
+                    duration=durations[i] if durations else None,
+                    disposal=disposals[i] if disposals else None,
+                )
+        self.encode_seconds = writer.encode_seconds
         return gif_name
 
 
@@ -131,6 +339,8 @@ class Angry_Jethalal_Beating_Goli(BaseGIFTemplate):
     id = 29
     name = "Angry_Jethalal_Beating_Goli"
     description = "Person A beating Person B for his silly mistake"
+    font_sizes = (30,)
+    caption_fields = ("depiction",)
 
     def __init__(self):
         super().__init__()
@@ -152,22 +362,17 @@ meme_creation_input:{"depiction":"Scenes in police station"}
 """
 
     def create(self, meme_text):
-        reader = self.get_template_gif()
-        frames = []
-
-        for frame in reader:
-            pil_frame = Image.fromarray(frame)
-            modified_frame = self.add_text_to_frame(pil_frame, meme_text["depiction"], position=(50,250), font_size=30,
-                                                    text_color='white')
-            frames.append(modified_frame)
-        gif_name = self.save_output_gif(frames)
-        return gif_name
+        return self.create_captioned_gif(meme_text["depiction"], position=(50, 250), font_size=30,
+                                         text_color='white')
 
 
 class Change_My_Mind(BaseMemeTemplate):
     id = 10
     name = "Change_My_Mind"
     description = "This is the way it is in my opinion"
+    captions = (
+        Text_Box("opinion", position=(500, 385), font_size=30, text_color="black", wrapped_width=22, rotate_degrees=20),
+    )
 
     def __init__(self):
         super().__init__()
@@ -189,26 +394,15 @@ meme_creation_input:{"opinion":"The best way to get a good grade in school is to
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image = Image_Manager.add_text(
-            base=base,
-            text=meme_text["opinion"],
-            position=(500, 385),
-            font_size=30,
-            text_color="black",
-            rotate_degrees=20,
-            wrapped_width=22,
-        )
-        base = Image.alpha_composite(base, overlay_image)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Equal(BaseMemeTemplate):
     id = 12
     name = "Equal"
     description = "something is the same as something else"
+    captions = (
+        Text_Box("first", position=(70, 180), font_size=45, wrapped_width=12, rotate_degrees=345),
+        Text_Box("second", position=(575, 100), font_size=45, wrapped_width=12, rotate_degrees=345),
+    )
 
     def __init__(self):
         super().__init__()
@@ -235,34 +429,15 @@ meme_creation_input:{"first":"alsdjkfa","second":"alsdjkfa"}
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image_1 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["first"],
-            position=(70, 180),
-            font_size=45,
-            wrapped_width=12,
-            rotate_degrees=345,
-        )
-        overlay_image_2 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["second"],
-            position=(575, 100),
-            font_size=45,
-            wrapped_width=12,
-            rotate_degrees=345,
-        )
-        base = Image.alpha_composite(base, overlay_image_1)
-        base = Image.alpha_composite(base, overlay_image_2)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Buff_Doge_Vs_Cheems(BaseMemeTemplate):
     id = 14
     name = "Buff_Doge_vs_cheems"
     description = "when someone is strong in one area but comically weak in another"
+    captions = (
+        Text_Box("strong", position=(70, 180), font_size=45, wrapped_width=12, rotate_degrees=345),
+        Text_Box("weak", position=(575, 100), font_size=45, wrapped_width=12, rotate_degrees=345),
+    )
 
     def __init__(self):
         super().__init__()
@@ -283,34 +458,14 @@ meme_creation_input:{"strong":"Manchester united in the first half", "weak":"Man
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image_1 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["strong"],
-            position=(70, 180),
-            font_size=45,
-            wrapped_width=12,
-            rotate_degrees=345,
-        )
-        overlay_image_2 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["weak"],
-            position=(575, 100),
-            font_size=45,
-            wrapped_width=12,
-            rotate_degrees=345,
-        )
-        base = Image.alpha_composite(base, overlay_image_1)
-        base = Image.alpha_composite(base, overlay_image_2)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Indifferent(BaseMemeTemplate):
     id = 2
     name = "Indifferent"
     description = "here is a guys who iburning a fact that he does not want to acknowledge because it is too painful"
+    captions = (
+        Text_Box("action", position=(100, 175), font_size=40, wrapped_width=11),
+    )
 
     def __init__(self):
         super().__init__()
@@ -340,24 +495,15 @@ meme_creation_input:{"action":"writing tests before writing code"}
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image = Image_Manager.add_text(
-            base=base,
-            text=meme_text["action"],
-            position=(100, 175),
-            font_size=40,
-            wrapped_width=11,
-        )
-        base = Image.alpha_composite(base, overlay_image)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Ineffective_Solution(BaseMemeTemplate):
     id = 9
     name = "Ineffective_Solution"
     description = "the solution was a poor way of doing it"
+    captions = (
+        Text_Box("attempted_solution", position=(75, 75), font_size=50, text_color="white", wrapped_width=14),
+        Text_Box("failure", position=(125, 725), font_size=50, text_color="white", wrapped_width=15, rotate_degrees=350),
+    )
 
     def __init__(self):
         super().__init__()
@@ -387,35 +533,15 @@ meme_creation_input:{"attempted_solution":"AI making memes", "failure":"The meme
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image_1 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["attempted_solution"],
-            position=(75, 75),
-            font_size=50,
-            text_color="white",
-            wrapped_width=14,
-        )
-        overlay_image_2 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["failure"],
-            position=(125, 725),
-            font_size=50,
-            text_color="white",
-            wrapped_width=15,
-            rotate_degrees=350,
-        )
-        base = Image.alpha_composite(base, overlay_image_1)
-        base = Image.alpha_composite(base, overlay_image_2)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class No_Responsibility(BaseMemeTemplate):
     id = 8
     name = "No_Responsibility"
     description = "two parties blaming each other for something"
+    captions = (
+        Text_Box("party_one", position=(175, 200), font_size=40, text_color="white", wrapped_width=12),
+        Text_Box("party_two", position=(800, 200), font_size=40, text_color="white", wrapped_width=12),
+    )
 
     def __init__(self):
         super().__init__()
@@ -443,34 +569,14 @@ meme_creation_input:{"party_one":"Team defence", "party_two":"Team attack"}
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image_1 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["party_one"],
-            position=(175, 200),
-            font_size=40,
-            text_color="white",
-            wrapped_width=12,
-        )
-        overlay_image_2 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["party_two"],
-            position=(800, 200),
-            font_size=40,
-            text_color="white",
-            wrapped_width=12,
-        )
-        base = Image.alpha_composite(base, overlay_image_1)
-        base = Image.alpha_composite(base, overlay_image_2)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Mujhe_Ghar_Jaana_Hai(BaseMemeTemplate):
     id = 23
     name = "Mujhe_Ghar_Jaana_Hai"
     description = "Somebody is clearly traumatized and wants to go home"
+    captions = (
+        Text_Box("who", position=(100, 115), font_size=100, text_color="white", wrapped_width=40),
+    )
 
     def __init__(self):
         super().__init__()
@@ -491,25 +597,14 @@ meme_creation_input:{"who":"Frances defenders seeing the speed of messi"}
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image = Image_Manager.add_text(
-            base=base,
-            text=meme_text["who"],
-            position=(100, 115),
-            font_size=100,
-            wrapped_width=40,
-            text_color="white"
-        )
-        base = Image.alpha_composite(base, overlay_image)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Guy_Chilling(BaseMemeTemplate):
     id = 38
     name = "Guy_Chilling"
     description = "Team or player relaxing with confidence"
+    captions = (
+        Text_Box("opinion", position=(50, 450), font_size=30, text_color="white", wrapped_width=40, rotate_degrees=0),
+    )
 
     def __init__(self):
         super().__init__()
@@ -531,26 +626,13 @@ meme_creation_input:{"opinion":"The face of someone who knows theyve already won
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image = Image_Manager.add_text(
-            base=base,
-            text=meme_text["opinion"],
-            position=(50, 450),
-            font_size=30,
-            text_color="white",
-            rotate_degrees=0,
-            wrapped_width=40,
-        )
-        base = Image.alpha_composite(base, overlay_image)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Jethalal_Angry(BaseGIFTemplate):
     id = 42
     name = "Jethalal_Angry"
     description = "Someone is really angry with what happened"
+    font_sizes = (30,)
+    caption_fields = ("who",)
 
     def __init__(self):
         super().__init__()
@@ -573,22 +655,19 @@ meme_creation_input:{"who":"The dugout after hardik starts hitting the ball hard
 """
 
     def create(self, meme_text):
-        reader = self.get_template_gif()
-        frames = []
-
-        for frame in reader:
-            pil_frame = Image.fromarray(frame)
-            modified_frame = self.add_text_to_frame(pil_frame, meme_text["who"], position=(50, 300), font_size=30,
-                                                    text_color='white')
-            frames.append(modified_frame)
-        gif_name = self.save_output_gif(frames)
-        return gif_name
+        return self.create_captioned_gif(meme_text["who"], position=(50, 300), font_size=30,
+                                         text_color='white')
 
 
 class Bike_Fall(BaseMemeTemplate):
     id = 13
     name = "Bike_Fall"
     description = "You yourself are the reason for your failure"
+    captions = (
+        Text_Box("first", position=(250, 100), font_size=25, text_color="black", wrapped_width=20),
+        Text_Box("second", position=(40, 350), font_size=25, text_color="black", wrapped_width=20),
+        Text_Box("third", position=(250, 500), font_size=25, text_color="black", wrapped_width=20),
+    )
 
     def __init__(self):
         super().__init__()
@@ -610,43 +689,14 @@ meme_creation_input:{"first": "Saturday", "second": "Sunday", "third":"Monday"}
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image_1 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["first"],
-            position=(250, 100),
-            font_size=25,
-            text_color="black",
-            wrapped_width=20
-        )
-        overlay_image_2 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["second"],
-            position=(40, 350),
-            font_size=25,
-            text_color="black",
-            wrapped_width=20
-        )
-        overlay_image_3 = Image_Manager.add_text(
-            base=base,
-            text=meme_text["third"],
-            position=(250, 500),
-            font_size=25,
-            text_color="black",
-            wrapped_width=20
-        )
-        base = Image.alpha_composite(base, overlay_image_1)
-        base = Image.alpha_composite(base, overlay_image_2)
-        base = Image.alpha_composite(base, overlay_image_3)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Thinking_About_Other_Women(BaseMemeTemplate):
     id = 21
     name = "Thinking_About_Other_Women"
     description = "the man is not talking to his wife because he is thinking. she thinks its about other women, but he is disturbed by other thoughts."
+    captions = (
+        Text_Box("thoughts", position=(650, 15), font_size=25, text_color="black", wrapped_width=20, rotate_degrees=0),
+    )
 
     def __init__(self):
         super().__init__()
@@ -668,26 +718,14 @@ meme_creation_input:{"thoughts":"Why did Rohit Sharma tried to hit another six?"
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image = Image_Manager.add_text(
-            base=base,
-            text=meme_text["thoughts"],
-            position=(650, 15),
-            font_size=25,
-            text_color="black",
-            rotate_degrees=0,
-            wrapped_width=20,
-        )
-        base = Image.alpha_composite(base, overlay_image)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Disaster_PakFan(BaseMemeTemplate):
     id = 32
     name = "disappointed-pak-fan"
     description = "This is the face of disappointment when expectations fail."
+    captions = (
+        Text_Box("opinion", position=(120, 385), font_size=50, text_color="white", wrapped_width=40, rotate_degrees=0),
+    )
 
     def __init__(self):
         super().__init__()
@@ -712,26 +750,14 @@ meme_creation_input:{"opinion":"The best way to deal with Mondays is to pretend
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        overlay_image = Image_Manager.add_text(
-            base=base,
-            text=meme_text["opinion"],
-            position=(120, 385),
-            font_size=50,
-            text_color="white",
-            rotate_degrees=0,
-            wrapped_width=40,
-        )
-        base = Image.alpha_composite(base, overlay_image)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Bored(BaseMemeTemplate):
     id = 61  # Assign a unique ID
     name = "sarfaraz-khan-yawning"
     description = "This meme shows a bored or uninterested expression"
+    captions = (
+        Text_Box("caption", position=(10, 50), font_size=15, text_color="black", wrapped_width=20),
+    )
 
     def __init__(self):
         super().__init__()
@@ -750,27 +776,14 @@ meme_creation_input:{"caption":"When you realize you forgot to charge your phone
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        # Add text for 'caption'
-        overlay_image = Image_Manager.add_text(
-            base=base,
-            text=meme_text["caption"],
-            position=(10, 50),  # Adjust the position based on where you'd like the text
-            font_size=15,
-            text_color="black",
-            wrapped_width=20,
-        )
-        # Combine overlays
-        base = Image.alpha_composite(base, overlay_image)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Confused(BaseMemeTemplate):
     id = 15  # Assign a unique ID
     name = "rohit_conf"
     description = "This meme shows a confused or perplexed expression - when it just goes over your head what happened"
+    captions = (
+        Text_Box("caption", position=(75, 200), font_size=100, text_color="black", wrapped_width=30),
+    )
 
     def __init__(self):
         super().__init__()
@@ -795,28 +808,14 @@ meme_creation_input:{"caption":"fans looking at coach sending A over B"}
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        # Add text for 'caption'
-        overlay_image = Image_Manager.add_text(
-            base=base,
-            text=meme_text["caption"],
-            position=(75, 200),  # Adjust based on where the text fits best
-            font_size=100,
-            text_color="black",
-            wrapped_width=30,
-        )
-        # Combine overlays
-        base = Image.alpha_composite(base, overlay_image)
-        image_name = self.save_output_image(base)
-        return image_name
-
-
 
 class Unintended_Damage(BaseMemeTemplate):
     id = 50 # Assign a unique ID
     name = "mujhe-kyu-toda"
     description = "Used when someone is destroyed and thrashed without it being their fault"
+    captions = (
+        Text_Box("who", position=(10, 150), font_size=15, text_color="white", wrapped_width=35),
+    )
 
     def __init__(self):
         super().__init__()
@@ -838,27 +837,14 @@ meme_creation_input:{"who":"Netherlands after the match"}
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        # Add text for 'caption'
-        overlay_image = Image_Manager.add_text(
-            base=base,
-            text=meme_text["who"],
-            position=(10, 150),  # Adjust position as needed
-            font_size=15,
-            text_color="white",
-            wrapped_width=35,
-        )
-        # Combine overlays
-        base = Image.alpha_composite(base, overlay_image)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 class Sad_Pablo(BaseMemeTemplate):
     id = 18  # Assign a unique ID
     name = "Sad-Pablo-Escobar"
     description = "This meme expresses the sadness and boredom associated with anticipation or waiting"
+    captions = (
+        Text_Box("caption", position=(50, 50), font_size=30, text_color="white", wrapped_width=30),
+    )
 
     def __init__(self):
         super().__init__()
@@ -877,22 +863,6 @@ meme_creation_input:{"caption":"When the weekend is almost over and you realize
 ###
 """
 
-    def create(self, meme_text):
-        base = self.get_template_image()
-        # Add text for 'caption'
-        overlay_image = Image_Manager.add_text(
-            base=base,
-            text=meme_text["caption"],
-            position=(50, 50),  # Adjust position as needed
-            font_size=30,
-            text_color="white",
-            wrapped_width=30,
-        )
-        # Combine overlays
-        base = Image.alpha_composite(base, overlay_image)
-        image_name = self.save_output_image(base)
-        return image_name
-
 
 # class Overconfident(BaseMemeTemplate):
 #     id = 19  # Assign a unique ID
@@ -936,6 +906,8 @@ class Dhol_Rajpal_Yadav(BaseGIFTemplate):
     id = 31
     name = "Dhol_Rajpal_Yadav"
     description = "An overconfident person celebrating the win after doing nothing"
+    font_sizes = (20,)
+    caption_fields = ("depiction",)
 
     def __init__(self):
         super().__init__()
@@ -957,16 +929,8 @@ meme_creation_input:{"depiction":"Ved Prakash during the celebration of the new
 """
 
     def create(self, meme_text):
-        reader = self.get_template_gif()
-        frames = []
-
-        for frame in reader:
-            pil_frame = Image.fromarray(frame)
-            modified_frame = self.add_text_to_frame(pil_frame, meme_text["depiction"], position=(40, 330), font_size=20,
-                                                    text_color='white')
-            frames.append(modified_frame)
-        gif_name = self.save_output_gif(frames)
-        return gif_name
+        return self.create_captioned_gif(meme_text["depiction"], position=(40, 330), font_size=20,
+                                         text_color='white')
 
 # Define the meme templates
 meme_templates = [
@@ -990,10 +954,17 @@ meme_templates = [
     Dhol_Rajpal_Yadav
 ]
 
-# Create the final dictionary
-all_memes = []
-for template in meme_templates:
-    all_memes.append({
-        "id": template.id,
-        "class": template
-    })
+
+def preload_fonts(templates=meme_templates):
+    for template in templates:
+        if issubclass(template, BaseMemeTemplate):
+            sizes = {box.font_size for box in template.captions} | {template.watermark_font_size}
+        else:
+            sizes = set(template.font_sizes)
+        font_registry.preload(template.font_path, sorted(sizes))
+
+
+def warm_template_cache(templates=meme_templates):
+    # Decode every static template up front so the first renders don't pay for disk and decode
+    paths = [template().get_template_path() for template in templates if issubclass(template, BaseMemeTemplate)]
+    template_cache.warm_up(paths)
@@ -0,0 +1,169 @@
+import json
+import re
+import threading
+from importlib.metadata import entry_points
+
+from PIL import Image
+from loguru import logger
+
+from memedo.models.meme_template import BaseGIFTemplate, meme_templates
+
+# Packages add templates by declaring an entry point in this group that resolves
+# to a template class or a list of them, e.g. in pyproject.toml:
+#   [project.entry-points."memedo.templates"]
+#   my_memes = "my_package.memes:templates"
+ENTRY_POINT_GROUP = "memedo.templates"
+# An example caption in a template's `instruction`
+EXAMPLE_INPUT = re.compile(r"meme_creation_input:\s*(\{.*\})")
+
+
+class Unknown_Template(KeyError):
+    pass
+
+
+class Template_Registry:
+    """
+    Meme template classes indexed by id and by (case-insensitive) name.
+
+    Only classes are held up front. An instance of each is made the first
+    time something needs one (its `instruction`, for the catalogue), and
+    `metadata` reads a template's file once for its size and frame count.
+    Plugin templates from the `memedo.templates` entry point group are
+    loaded on first lookup, not at import.
+    """
+
+    def __init__(self, templates=(), discover_plugins=True):
+        self._by_id = {}
+        self._by_name = {}
+        self._instances = {}
+        self._metadata = {}
+        self._catalogue = None
+        self._lock = threading.RLock()
+        self._plugins_loaded = not discover_plugins
+        for template in templates:
+            self.register(template)
+
+    def register(self, template):
+        with self._lock:
+            existing = self._by_id.get(template.id)
+            if existing is not None and existing is not template:
+                raise ValueError(f"Template id {template.id} is taken by {existing.__name__}, "
+                                 f"can't register {template.__name__}")
+            self._by_id[template.id] = template
+            self._by_name[template.name.lower()] = template
+            self._catalogue = None
+        return template
+
+    def _load_plugins(self):
+        if self._plugins_loaded:
+            return
+        with self._lock:
+            if self._plugins_loaded:
+                return
+            self._plugins_loaded = True
+            for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+                try:
+                    loaded = entry_point.load()
+                    for template in loaded if isinstance(loaded, (list, tuple)) else [loaded]:
+                        self.register(template)
+                except Exception:
+                    logger.exception(f"Could not load meme templates from plugin {entry_point.name}")
+
+    def get(self, template_id):
+        """The template class with this id; raises Unknown_Template if there is none."""
+        self._load_plugins()
+        try:
+            return self._by_id[template_id]
+        except KeyError:
+            raise Unknown_Template(template_id) from None
+
+    def by_name(self, name):
+        self._load_plugins()
+        try:
+            return self._by_name[name.lower()]
+        except KeyError:
+            raise Unknown_Template(name) from None
+
+    def __contains__(self, template_id):
+        self._load_plugins()
+        return template_id in self._by_id
+
+    def __iter__(self):
+        self._load_plugins()
+        return iter(list(self._by_id.values()))
+
+    def __len__(self):
+        self._load_plugins()
+        return len(self._by_id)
+
+    def instance(self, template_id):
+        """A shared instance of the template, for reading its attributes. Render with a fresh one."""
+        template = self.get(template_id)
+        instance = self._instances.get(template_id)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(template_id)
+                if instance is None:
+                    instance = self._instances[template_id] = template()
+        return instance
+
+    def catalogue(self):
+        """id, name, description and instruction of every template, as sent to the meme LLM."""
+        self._load_plugins()
+        with self._lock:
+            if self._catalogue is None:
+                self._catalogue = [{
+                    "id": template.id,
+                    "name": template.name,
+                    "description": template.description,
+                    "instruction": self.instance(template.id).instruction.strip(),
+                } for template in self._by_id.values()]
+            return self._catalogue
+
+    def caption_fields(self, template_id):
+        """The `meme_creation_input` fields the template's `create` reads."""
+        template = self.get(template_id)
+        if issubclass(template, BaseGIFTemplate):
+            return list(template.caption_fields)
+        return [box.field for box in template.captions]
+
+    def example_inputs(self, template_id):
+        """The template's own example captions, or a placeholder for each caption field if it has none."""
+        examples = []
+        for match in EXAMPLE_INPUT.finditer(self.instance(template_id).instruction):
+            try:
+                examples.append(json.loads(match.group(1)))
+            except json.JSONDecodeError:
+                continue
+        if not examples:
+            examples = [{field: "India lost the toss and then the match" for field in self.caption_fields(template_id)}]
+        return examples
+
+    def metadata(self, template_id):
+        """Kind, template path, size in pixels, frame count, caption fields and example captions of a template."""
+        metadata = self._metadata.get(template_id)
+        if metadata is not None:
+            return metadata
+        template = self.get(template_id)
+        instance = self.instance(template_id)
+        gif = isinstance(instance, BaseGIFTemplate)
+        path = instance.get_template_gif_path() if gif else instance.get_template_path()
+        with Image.open(path) as image:
+            width, height = image.size
+            frames = getattr(image, "n_frames", 1)
+        metadata = {
+            "id": template.id,
+            "name": template.name,
+            "kind": "gif" if gif else "image",
+            "path": path,
+            "width": width,
+            "height": height,
+            "frames": frames,
+            "caption_fields": self.caption_fields(template_id),
+            "example_inputs": self.example_inputs(template_id),
+        }
+        self._metadata[template_id] = metadata
+        return metadata
+
+
+template_registry = Template_Registry(meme_templates)
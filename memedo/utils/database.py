@@ -0,0 +1,204 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import asdict, is_dataclass
+
+from fastcore.xtras import UNSET
+from fastlite import database
+from loguru import logger
+
+
+def _row_values(row):
+    """A dict or (fastlite) dataclass row as a dict, without the fields left unset. None is kept, as NULL."""
+    if is_dataclass(row):
+        row = asdict(row)
+    return {k: v for k, v in row.items() if v is not UNSET}
+
+
+def configure_connection(conn, busy_timeout_ms, synchronous):
+    """WAL, a busy timeout and the fsync level, for any sqlite3 connection to the file."""
+    if synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        raise ValueError(f"Unknown SQLite synchronous level {synchronous!r}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    conn.execute(f"PRAGMA synchronous = {synchronous}")
+
+
+class Thread_Table:
+    """
+    A fastlite table bound to the calling thread's connection. Behaves like
+    the table itself (call it, `.get`, `.columns_dict`, ...), and remembers
+    the dataclass made by `dataclass()` so every thread's rows come back as
+    instances of it.
+    """
+
+    def __init__(self, db, name):
+        self._db = db
+        self._name = name
+        self._local = threading.local()
+        self.cls = None
+
+    def _table(self):
+        table = getattr(self._local, "table", None)
+        if table is None:
+            table = self._local.table = self._db.connection().t[self._name]
+        if self.cls is not None:
+            table.cls = self.cls
+        return table
+
+    def dataclass(self):
+        self.cls = self._table().dataclass()
+        return self.cls
+
+    def __getattr__(self, name):
+        return getattr(self._table(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._table()(*args, **kwargs)
+
+
+class Write_Batch_Database:
+    """
+    A SQLite file shared by request handlers and background workers.
+
+    Reads use one connection per thread; with WAL they never wait on a write.
+    Writes (`write`, `insert`, `update`) go to a single writer thread, which
+    commits everything queued since its last commit as one transaction, so
+    concurrent generations neither fight over the write lock nor pay an fsync
+    per row. Each returns a Future of the statement's lastrowid, resolved once
+    it is committed; a failing statement fails only its own Future.
+    """
+
+    def __init__(self, path, busy_timeout_ms=5000, synchronous="NORMAL", batch_size=128, batch_wait=0.0):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._local = threading.local()
+        self._connections = 0
+        self._writes = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._statements = 0
+        self._failed = 0
+        self._largest_batch = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def connection(self):
+        """This thread's fastlite connection."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = database(self.path)
+            configure_connection(db.conn, self.busy_timeout_ms, self.synchronous)
+            with self._lock:
+                self._connections += 1
+        return db
+
+    @property
+    def t(self):
+        return self.connection().t
+
+    def table(self, name):
+        return Thread_Table(self, name)
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def write(self, sql, params=()):
+        future = Future()
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+                self._writer.start()
+        self._writes.put((sql, list(params), future))
+        return future
+
+    def insert(self, table, row):
+        row = _row_values(row)
+        columns = ", ".join(f"[{k}]" for k in row)
+        placeholders = ", ".join("?" for _ in row)
+        return self.write(f"INSERT INTO [{table}] ({columns}) VALUES ({placeholders})", row.values())
+
+    def update(self, table, values, pk="id"):
+        """Update the row whose `pk` is values[pk] with the rest of `values` (unset ones are skipped)."""
+        values = _row_values(values)
+        key = values.pop(pk)
+        assignments = ", ".join(f"[{k}] = ?" for k in values)
+        return self.write(f"UPDATE [{table}] SET {assignments} WHERE [{pk}] = ?", [*values.values(), key])
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        configure_connection(conn, self.busy_timeout_ms, self.synchronous)
+        stopping = False
+        while not stopping:
+            item = self._writes.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(conn, batch)
+        conn.close()
+
+    def _commit(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for sql, params, future in batch:
+                # A savepoint per statement keeps one bad write from undoing the rest of the batch
+                conn.execute("SAVEPOINT write")
+                try:
+                    results.append((future, conn.execute(sql, params).lastrowid, None))
+                    conn.execute("RELEASE write")
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.exception(f"Write batch of {len(batch)} statements to {self.path} failed")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(future, None, e) for _, _, future in batch]
+        with self._lock:
+            self._batches += 1
+            self._statements += len(batch)
+            self._failed += sum(1 for _, _, error in results if error is not None)
+            self._largest_batch = max(self._largest_batch, len(batch))
+        for future, rowid, error in results:
+            if error is None:
+                future.set_result(rowid)
+            else:
+                future.set_exception(error)
+
+    def close(self, timeout=10):
+        """Commit queued writes and stop the writer; the next write starts a new one."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._writes.put(None)
+            writer.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "statements": self._statements,
+                "failed": self._failed,
+                "largest_batch": self._largest_batch,
+                "queued": self._writes.qsize(),
+                "read_connections": self._connections,
+            }
@@ -0,0 +1,54 @@
+import threading
+from collections import OrderedDict
+
+from memedo import config
+
+
+class Fragment_Cache:
+    """
+    LRU cache of rendered HTML fragments, keyed on whatever the caller likes
+    (a finished generation's id for gallery cards).
+
+    Only cache fragments that can't change: there is no invalidation beyond
+    `discard` and eviction.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        """The cached fragment for `key`, calling `render()` to produce it on a miss."""
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+        html = render()
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+card_cache = Fragment_Cache(config.CARD_CACHE_MAX_ENTRIES)
@@ -1,4 +1,6 @@
+import math
 import os, sys
+import threading
 import traceback
 
 from PIL import Image, ImageDraw, ImageFont
@@ -21,6 +23,74 @@ def wrap(text, width):
     return new_text
 
 
+class Font_Registry:
+    """
+    Shared registry of loaded fonts keyed on (font_path, size).
+
+    `ImageFont.truetype` parses the font file on every call, so both the static
+    and the GIF render paths fetch fonts from here instead.
+    """
+
+    def __init__(self):
+        self._fonts = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, size):
+        key = (path, size)
+        font = self._fonts.get(key)
+        if font is None:
+            with self._lock:
+                font = self._fonts.get(key)
+                if font is None:
+                    font = ImageFont.truetype(path, size)
+                    self._fonts[key] = font
+        return font
+
+    def preload(self, path, sizes):
+        for size in sizes:
+            self.get(path, size)
+
+    def loaded(self):
+        return sorted(self._fonts)
+
+
+font_registry = Font_Registry()
+
+
+class Text_Box:
+    """
+    One caption slot on a static template: which `meme_creation_input` field
+    it shows and where and how it is drawn. Same arguments as
+    `Image_Manager.add_text`.
+    """
+
+    def __init__(self, field, position, font_size, text_color="black", wrapped_width=None, rotate_degrees=None):
+        self.field = field
+        self.position = position
+        self.font_size = font_size
+        self.text_color = text_color
+        self.wrapped_width = wrapped_width
+        self.rotate_degrees = rotate_degrees
+
+
+def _text_fill(text_color):
+    if text_color == "white":
+        return (255, 255, 255, 255)
+    return (0, 0, 0, 255)
+
+
+def _rotation_matrix(size, degrees):
+    # The inverse affine matrix `Image.rotate` uses for a rotation about the centre
+    w, h = size
+    angle = -math.radians(degrees)
+    a, b = round(math.cos(angle), 15), round(math.sin(angle), 15)
+    d, e = round(-math.sin(angle), 15), round(math.cos(angle), 15)
+    cx, cy = w / 2, h / 2
+    c = a * -cx + b * -cy + cx
+    f = d * -cx + e * -cy + cy
+    return a, b, c, d, e, f
+
+
 class Image_Manager:
     def __init__(self):
         print("Image manager create")
@@ -39,17 +109,23 @@ class Image_Manager:
 
         try:
             overlay_image = Image.new("RGBA", base.size, (0, 0, 0, 0))
+            if rotate_degrees:
+                # Rotate only the text's bounding box, not the whole overlay
+                layer, origin = Image_Manager.render_rotated_text(base.size, text, position, font_size, text_color,
+                                                                  wrapped_width, rotate_degrees)
+                if layer is not None:
+                    overlay_image.paste(layer, origin)
+                return overlay_image
+
             if wrapped_width is not None:
                 text = wrap(text, wrapped_width)
 
-            font = ImageFont.truetype(font_path, font_size)
+            font = font_registry.get(font_path, font_size)
             draw = ImageDraw.Draw(overlay_image)
             fill = (0, 0, 0, 255)
             if text_color == "white":
                 fill = (255, 255, 255, 255)
             draw.text(position, text, font=font, fill=fill)
-            if rotate_degrees is not None:
-                overlay_image = overlay_image.rotate(rotate_degrees)
 
             return overlay_image
         except Exception as e:
@@ -60,3 +136,96 @@ class Image_Manager:
             print(f"line: {exc_tb.tb_lineno}")
             print(f"file: {fname}")
             return "error"
+
+    @staticmethod
+    def render_text_layer(canvas_size, text, position, font_size, text_color="black", wrapped_width=None):
+        """
+        Draw text into a layer cropped to its bounding box.
+
+        Returns the layer and its top-left corner on a canvas of `canvas_size`,
+        or (None, None) if nothing of the text lands on the canvas.
+        """
+        if wrapped_width is not None:
+            text = wrap(text, wrapped_width)
+        font = font_registry.get(font_path, font_size)
+
+        left, top, right, bottom = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox(position, text, font=font)
+        # One pixel of slack for anti-aliased edges; clip to the canvas like a full-size overlay would
+        left, top = max(0, math.floor(left) - 1), max(0, math.floor(top) - 1)
+        right, bottom = min(canvas_size[0], math.ceil(right) + 1), min(canvas_size[1], math.ceil(bottom) + 1)
+        if right <= left or bottom <= top:
+            return None, None
+
+        layer = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+        ImageDraw.Draw(layer).text((position[0] - left, position[1] - top), text, font=font,
+                                   fill=_text_fill(text_color))
+        return layer, (left, top)
+
+    @staticmethod
+    def rotate_layer(layer, origin, canvas_size, degrees):
+        """
+        Rotate a layer placed at `origin` as if the whole `canvas_size` overlay
+        were rotated about its centre with `Image.rotate`, but only transforming
+        the pixels around the layer.
+
+        Returns the rotated layer and where to paste it on the canvas, or
+        (None, None) if it rotates off the canvas.
+        """
+        a, b, c, d, e, f = _rotation_matrix(canvas_size, degrees)
+        sx, sy = origin
+
+        # `Image.rotate` maps destination pixels back to the source with
+        # (a, b, c, d, e, f). The forward map is its transpose, which gives
+        # where the layer's corners end up.
+        corners = []
+        for x, y in ((sx, sy), (sx + layer.width, sy), (sx, sy + layer.height), (sx + layer.width, sy + layer.height)):
+            x, y = x - c, y - f
+            corners.append((a * x + d * y, b * x + e * y))
+        left = max(0, math.floor(min(x for x, _ in corners)) - 1)
+        top = max(0, math.floor(min(y for _, y in corners)) - 1)
+        right = min(canvas_size[0], math.ceil(max(x for x, _ in corners)) + 1)
+        bottom = min(canvas_size[1], math.ceil(max(y for _, y in corners)) + 1)
+        if right <= left or bottom <= top:
+            return None, None
+
+        # Same inverse map, shifted so both sides use the cropped coordinates
+        matrix = (a, b, c + a * left + b * top - sx, d, e, f + d * left + e * top - sy)
+        rotated = layer.transform((right - left, bottom - top), Image.Transform.AFFINE, matrix, Image.Resampling.NEAREST)
+        return rotated, (left, top)
+
+    @staticmethod
+    def render_rotated_text(canvas_size, text, position, font_size, text_color, wrapped_width, rotate_degrees):
+        """
+        Rotated text as a tight layer plus where to paste it, matching a
+        full-size overlay rotated with `Image.rotate`. (None, None) if nothing
+        ends up on the canvas.
+        """
+        layer, origin = Image_Manager.render_text_layer(canvas_size, text, position, font_size, text_color,
+                                                        wrapped_width)
+        if layer is None:
+            return None, None
+        return Image_Manager.rotate_layer(layer, origin, canvas_size, rotate_degrees)
+
+    @staticmethod
+    def add_captions(base, captions):
+        """
+        Draw several captions onto `base` with a single overlay and composite.
+
+        `captions` is a list of (Text_Box, text) pairs. Unrotated text is drawn
+        straight onto the shared overlay; rotated text is drawn and rotated in
+        its own tight layer before being pasted in.
+        """
+        overlay = Image.new("RGBA", base.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        for box, text in captions:
+            if not box.rotate_degrees:
+                if box.wrapped_width is not None:
+                    text = wrap(text, box.wrapped_width)
+                font = font_registry.get(font_path, box.font_size)
+                draw.text(box.position, text, font=font, fill=_text_fill(box.text_color))
+                continue
+            layer, origin = Image_Manager.render_rotated_text(base.size, text, box.position, box.font_size,
+                                                              box.text_color, box.wrapped_width, box.rotate_degrees)
+            if layer is not None:
+                overlay.alpha_composite(layer, origin)
+        return Image.alpha_composite(base, overlay)
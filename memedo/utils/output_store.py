@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from loguru import logger
+
+from memedo import config
+
+
+class Output_Store:
+    """
+    Content-addressed store of rendered memes in one directory.
+
+    A render is named after `key(...)` of everything that decides its bytes,
+    so an identical request finds the file by name and skips rendering. Past
+    `max_bytes` the least recently used files are deleted, oldest first; a
+    hit counts as a use and bumps the file's mtime, so the order survives a
+    restart. The directory is scanned on first use.
+
+    Evicted files may still be referenced elsewhere (the gallery's rows), so
+    `on_evict`, if set, is called with the paths of the files removed.
+    """
+
+    def __init__(self, directory, max_bytes, on_evict=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._files = None  # file name -> size, least recently used first
+        self._file_hashes = {}  # (path, mtime_ns, size) -> sha256
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(*parts):
+        """A hash of JSON-serializable parts (dict keys sorted), for use as a file name."""
+        data = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def file_hash(self, path):
+        """sha256 of a file's contents, remembered until the file changes."""
+        stat = os.stat(path)
+        cache_key = (path, stat.st_mtime_ns, stat.st_size)
+        digest = self._file_hashes.get(cache_key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(block)
+            digest = self._file_hashes[cache_key] = sha.hexdigest()
+        return digest
+
+    def _index(self):
+        if self._files is None:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith(".part"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+            self._files = OrderedDict((name, size) for _, name, size in sorted(entries))
+            self.bytes = sum(self._files.values())
+        return self._files
+
+    def lookup(self, file_name):
+        """True if `file_name` is stored (and now the most recently used), else False."""
+        path = os.path.join(self.directory, file_name)
+        with self._lock:
+            files = self._index()
+            if file_name in files and os.path.exists(path):
+                files.move_to_end(file_name)
+                self.hits += 1
+            else:
+                files.pop(file_name, None)
+                self.misses += 1
+                return False
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return True
+
+    def add(self, file_name):
+        """Record a file just written to the directory, then evict down to `max_bytes`."""
+        size = os.path.getsize(os.path.join(self.directory, file_name))
+        with self._lock:
+            files = self._index()
+            self.bytes += size - files.pop(file_name, 0)
+            files[file_name] = size
+            evicted = []
+            while self.bytes > self.max_bytes and len(files) > 1:
+                name, size = files.popitem(last=False)
+                self.bytes -= size
+                evicted.append(name)
+            self.evictions += len(evicted)
+        removed = []
+        for name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, name))
+                removed.append(os.path.join(self.directory, name))
+            except OSError as e:
+                logger.warning(f"Could not evict {name} from {self.directory}: {e}")
+        if removed and self.on_evict is not None:
+            try:
+                self.on_evict(removed)
+            except Exception:
+                logger.exception(f"Handling the eviction of {len(removed)} files from {self.directory} failed")
+
+    def stats(self):
+        with self._lock:
+            files = self._index()
+            return {
+                "files": len(files),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+output_store = Output_Store("memedo/out/creations", config.OUTPUT_STORE_MAX_BYTES)
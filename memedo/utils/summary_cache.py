@@ -0,0 +1,171 @@
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from memedo import config
+
+_MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+_MONTH = r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?" \
+         r"|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(\d{4})"
+
+# (pattern, order of the day/month/year groups)
+_DATE_PATTERNS = [
+    (re.compile(rf"\b{_DAY}\s+(?:of\s+)?{_MONTH},?\s+{_YEAR}\b"), "dmy"),
+    (re.compile(rf"\b{_MONTH}\s+{_DAY},?\s+{_YEAR}\b"), "mdy"),
+    (re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b"), "ymd"),
+    # Numeric dates are read day first, the way our (mostly Indian) users write them
+    (re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b"), "dmy"),
+]
+
+
+def _iso_date(match, order):
+    parts = dict(zip(order, match.groups()))
+    month = parts["m"]
+    month = _MONTHS[month[:3]] if month[:3] in _MONTHS else int(month)
+    try:
+        return datetime.date(int(parts["y"]), month, int(parts["d"])).isoformat()
+    except ValueError:
+        return match.group(0)
+
+
+def normalize_prompt(prompt):
+    """
+    Reduce a prompt to a cache key: lower case, dates as YYYY-MM-DD, no
+    punctuation, single spaces. "India vs New Zealand, 17th Oct 2024" and
+    "india vs new zealand 2024-10-17" end up the same.
+    """
+    text = prompt.lower()
+    for pattern, order in _DATE_PATTERNS:
+        text = pattern.sub(lambda match: _iso_date(match, order), text)
+    text = re.sub(r"[^\w\s-]|(?<!\d)-|-(?!\d)", " ", text)
+    return " ".join(text.split())
+
+
+class Summary_Cache:
+    """
+    SQLite-backed cache of match summaries keyed on the normalized prompt.
+
+    Entries expire `ttl` seconds after they were fetched, since a live match
+    keeps changing. Past `max_entries`, the least recently read ones go. The
+    database is opened on first use.
+    """
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._connection = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _db(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, prompt TEXT, summary TEXT, created_at REAL, last_used REAL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used)")
+        return self._connection
+
+    def get(self, key, count=True):
+        """The cached summary, or None. `count` off leaves the hit and miss counts alone, for re-checks."""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT summary, created_at FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    db.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                    db.commit()
+                self.misses += count
+                return None
+            db.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += count
+            return row[0]
+
+    def put(self, key, prompt, summary):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)", (key, prompt, summary, now, now))
+            evicted = db.execute(
+                "DELETE FROM summaries WHERE key IN "
+                "(SELECT key FROM summaries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            db.commit()
+            self.evictions += evicted
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM summaries")
+            self._db().commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._db().execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Single_Flight:
+    """Collapse concurrent calls for the same key into one; every caller gets its result."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+summary_cache = Summary_Cache(config.SUMMARY_CACHE_PATH, config.SUMMARY_CACHE_TTL, config.SUMMARY_CACHE_MAX_ENTRIES)
@@ -0,0 +1,95 @@
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+from loguru import logger
+
+from memedo import config
+
+
+class Template_Cache:
+    """
+    Process-wide, size-bounded LRU cache of decoded RGBA template images.
+    Renders run in the render pool's workers, so each worker has its own
+    cache and `max_bytes` applies per worker; the app reads their stats via
+    meme_generator.template_cache_stats.
+
+    Entries are keyed on the template path and its mtime, so a template that is
+    replaced on disk gets decoded again. The cached image is never handed out:
+    `get` returns a copy, so callers can draw on it freely. A copy is a plain
+    memcpy, which is far cheaper than re-reading and decoding a multi-MB file.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+
+    @staticmethod
+    def _image_bytes(image):
+        return image.width * image.height * len(image.getbands())
+
+    def _load(self, path):
+        with Image.open(path) as image:
+            return image.convert("RGBA")
+
+    def get(self, path):
+        key = (path, os.path.getmtime(path))
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image.copy()
+            self.misses += 1
+
+        # Decode outside the lock so a slow template doesn't block other renders
+        image = self._load(path)
+        self._store(key, image)
+        return image.copy()
+
+    def _store(self, key, image):
+        size = self._image_bytes(image)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = image
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= self._image_bytes(evicted)
+                self.evictions += 1
+
+    def warm_up(self, paths):
+        for path in paths:
+            try:
+                self.get(path)
+            except OSError as e:
+                logger.warning(f"Could not warm template {path}: {e}")
+        logger.info(f"Template cache warmed: {self.stats()}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+template_cache = Template_Cache(config.TEMPLATE_CACHE_MAX_BYTES)
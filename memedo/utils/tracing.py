@@ -0,0 +1,244 @@
+import contextlib
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from loguru import logger
+
+from memedo import config
+
+# Upper bounds in seconds: renders take tens to hundreds of milliseconds, LLM calls seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Span attributes that also become histogram labels; the rest only go to OpenTelemetry
+LABEL_ATTRIBUTES = ("template",)
+
+_generation = contextvars.ContextVar("memedo_generation", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+
+
+class Stage_Histograms:
+    """Span durations by label set, as a Prometheus histogram family."""
+
+    def __init__(self, name, help, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # sorted label pairs -> [count per bucket (+Inf last), sum]
+
+    def observe(self, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def exposition(self):
+        """The family in the Prometheus text format."""
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in sorted(self._series.items())]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (None,), counts):
+                cumulative += count
+                le = "+Inf" if bound is None else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(key)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(key)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+class Generation_Trace:
+    """The spans finished so far for one generation, for its timing summary."""
+
+    def __init__(self, generation_id):
+        self.generation_id = generation_id
+        self.durations = defaultdict(list)
+
+    def summary(self):
+        parts = []
+        for stage, durations in self.durations.items():
+            if len(durations) == 1:
+                parts.append(f"{stage} {durations[0]:.2f}s")
+            else:
+                parts.append(f"{stage} {len(durations)}x (total {sum(durations):.2f}s, slowest {max(durations):.2f}s)")
+        return ", ".join(parts)
+
+
+class Span:
+    """
+    One timed stage. Use it as a context manager, or call `end` yourself,
+    from any thread, for a stage that finishes somewhere else.
+    """
+
+    __slots__ = ("tracer", "stage", "attributes", "trace", "started", "_otel_span", "_otel_token")
+
+    def __init__(self, tracer, stage, attributes):
+        self.tracer = tracer
+        self.stage = stage
+        self.attributes = attributes
+        self.trace = _generation.get()
+        self._otel_span = tracer._start_otel_span(stage, self.trace, attributes)
+        self._otel_token = None
+        self.started = time.perf_counter()
+
+    def end(self, status="ok"):
+        seconds = time.perf_counter() - self.started
+        self.tracer._finish(self.stage, seconds, status, self.trace, self.attributes, self._otel_span)
+        return seconds
+
+    def __enter__(self):
+        if self._otel_span is not None:
+            # Spans opened inside this one become its children
+            self._otel_token = self.tracer._attach(self._otel_span)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._otel_token is not None:
+            self.tracer._detach(self._otel_token)
+        self.end("ok" if exc_type is None else "error")
+
+
+class _Null_Span:
+    def end(self, status="ok"):
+        return 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_null_span = _Null_Span()
+
+
+class Stage_Tracer:
+    """
+    Times the stages of a generation (summary, selection, each render and its
+    encode, saving the images, the final DB update) and keeps every duration
+    in a histogram by stage, status and template, served on /metrics.
+
+    With `otel_endpoint` set, each span is also exported as an OpenTelemetry
+    span to that OTLP/HTTP collector, under one root span per generation.
+    The OpenTelemetry SDK is imported on the first span and is optional: if
+    it isn't installed, only the histograms are kept. With `enabled` off,
+    spans are a shared no-op object and nothing is recorded.
+    """
+
+    def __init__(self, enabled=True, otel_endpoint=None, service_name="memedo"):
+        self.enabled = enabled
+        self.otel_endpoint = otel_endpoint
+        self.service_name = service_name
+        self.histograms = Stage_Histograms("memedo_stage_duration_seconds",
+                                           "Duration of each generation stage in seconds.")
+        self._otel = None  # (tracer provider, tracer, opentelemetry.context, opentelemetry.trace) once set up
+        self._otel_lock = threading.Lock()
+
+    def _otel_tracer(self):
+        if self._otel is not None or not self.otel_endpoint:
+            return self._otel
+        with self._otel_lock:
+            if self._otel is None and self.otel_endpoint:
+                try:
+                    from opentelemetry import context, trace
+                    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                    from opentelemetry.sdk.resources import Resource
+                    from opentelemetry.sdk.trace import TracerProvider
+                    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                except ImportError:
+                    logger.warning("MEMEDO_OTEL_ENDPOINT is set but the OpenTelemetry SDK and OTLP/HTTP exporter "
+                                   "aren't installed; keeping stage timings in /metrics only")
+                    self.otel_endpoint = None
+                    return None
+                provider = TracerProvider(resource=Resource.create({"service.name": self.service_name}))
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=self.otel_endpoint)))
+                self._otel = (provider, provider.get_tracer("memedo"), context, trace)
+        return self._otel
+
+    def _start_otel_span(self, stage, trace, attributes, start_time=None):
+        otel = self._otel_tracer()
+        if otel is None:
+            return None
+        otel_attributes = {f"memedo.{name}": value for name, value in attributes.items() if value is not None}
+        if trace is not None:
+            otel_attributes["memedo.generation_id"] = trace.generation_id
+        return otel[1].start_span(stage, attributes=otel_attributes, start_time=start_time)
+
+    def _attach(self, otel_span):
+        _, _, context, trace = self._otel
+        return context.attach(trace.set_span_in_context(otel_span))
+
+    def _detach(self, token):
+        self._otel[2].detach(token)
+
+    def _finish(self, stage, seconds, status, trace, attributes, otel_span, end_time=None):
+        labels = {name: attributes[name] for name in LABEL_ATTRIBUTES if attributes.get(name) is not None}
+        self.histograms.observe(seconds, stage=stage, status=status, **labels)
+        if trace is not None:
+            trace.durations[stage].append(seconds)
+        if otel_span is not None:
+            otel_span.set_attribute("memedo.status", status)
+            if status not in ("ok", "cached"):
+                otel_span.set_status(self._otel[3].StatusCode.ERROR)
+            otel_span.end(end_time=end_time)
+
+    def span(self, stage, **attributes):
+        """A Span for `stage`, started now. Attributes: template (a label), plus anything for OpenTelemetry."""
+        if not self.enabled:
+            return _null_span
+        return Span(self, stage, attributes)
+
+    def record(self, stage, seconds, status="ok", **attributes):
+        """Record a stage that was timed elsewhere (in a render worker) and ended just now."""
+        if not self.enabled:
+            return
+        trace = _generation.get()
+        otel_span, end_time = None, None
+        if self._otel_tracer() is not None:
+            end_time = time.time_ns()
+            otel_span = self._start_otel_span(stage, trace, attributes, start_time=end_time - int(seconds * 1e9))
+        self._finish(stage, seconds, status, trace, attributes, otel_span, end_time)
+
+    @contextlib.contextmanager
+    def generation(self, generation_id):
+        """
+        Group the spans opened inside (in this thread, or tasks and threads
+        started from it) under one generation: they carry its id, and its
+        stage timings are logged on the way out.
+        """
+        if not self.enabled:
+            yield None
+            return
+        trace = Generation_Trace(generation_id)
+        token = _generation.set(trace)
+        try:
+            with self.span("generation"):
+                yield trace
+        finally:
+            _generation.reset(token)
+            logger.info(f"Generation {generation_id} timings: {trace.summary()}")
+
+    def metrics(self):
+        return self.histograms.exposition()
+
+    def shutdown(self):
+        """Flush spans still waiting to be exported."""
+        if self._otel is not None:
+            self._otel[0].shutdown()
+
+
+tracer = Stage_Tracer(config.TRACING_ENABLED, config.OTEL_ENDPOINT, config.OTEL_SERVICE_NAME)
@@ -0,0 +1,40 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The app reads its settings at import and writes relative to the working directory
+# (.sesskey, memedo/out), so tests run in a scratch directory with their own database
+WORKDIR = tempfile.mkdtemp(prefix="memedo-tests-")
+os.environ.update(
+    MEMEDO_GENS_DB_PATH=os.path.join(WORKDIR, "gens.db"),
+    MEMEDO_GENERATION_PENDING_PATH=os.path.join(WORKDIR, "pending_jobs.jsonl"),
+    MEMEDO_SUMMARY_CACHE_PATH=os.path.join(WORKDIR, "summary_cache.db"),
+)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.chdir(WORKDIR)
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import app
+    app.setup_gens_db()
+    yield app
+    app.db.close()
+
+
+@pytest.fixture
+def client(app_module):
+    from starlette.testclient import TestClient
+    # No lifespan: the generation workers and render pool aren't needed
+    return TestClient(app_module.app)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
@@ -0,0 +1,12 @@
+from fastcore.xtras import UNSET
+
+from memedo.utils.database import Write_Batch_Database
+
+
+def test_update_sets_none_to_null_and_skips_unset_fields(tmp_path):
+    db = Write_Batch_Database(str(tmp_path / "test.db"))
+    db.execute("CREATE TABLE gens (id INTEGER PRIMARY KEY, prompt TEXT, created_at REAL)")
+    id = db.insert("gens", {"prompt": "x", "created_at": 1.0}).result()
+    db.update("gens", {"id": id, "prompt": UNSET, "created_at": None}).result()
+    db.close()
+    assert db.execute("SELECT prompt, created_at FROM gens").fetchall() == [("x", None)]
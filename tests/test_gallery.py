@@ -0,0 +1,23 @@
+import time
+
+import pytest
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "1.5", "1.5:x", "x:3", "1:2:3"])
+def test_malformed_cursor_is_a_bad_request(client, cursor):
+    assert client.get("/gallery", params={"before": cursor}).status_code == 400
+    response = client.get("/api/gallery", params={"before": cursor})
+    assert response.status_code == 400
+    assert response.json() == {"error": "bad cursor"}
+
+
+def test_cursor_pages_through_the_gallery(app_module, client):
+    created_at = time.time() + 1000
+    ids = [app_module.db.insert('gens', app_module.Generation(prompt=f"page {i}", paths='[]', done=True,
+                                                              created_at=created_at + i)).result()
+           for i in range(3)]
+    first = client.get("/api/gallery", params={"limit": 2}).json()
+    assert [item["id"] for item in first["items"]] == ids[:0:-1]
+    second = client.get("/api/gallery", params={"limit": 2, "before": first["next"]}).json()
+    assert second["items"][0]["id"] == ids[0]
+    assert client.get("/gallery", params={"before": first["next"]}).status_code == 200
@@ -0,0 +1,35 @@
+import threading
+
+from memedo.controllers.job_queue import Job_Queue
+
+
+def test_shutdown_waits_for_workers_and_persists_what_did_not_finish(tmp_path):
+    started, release = threading.Event(), threading.Event()
+    ran = []
+
+    def handler(job_id, prompt):
+        ran.append(job_id)
+        started.set()
+        release.wait()
+
+    persist_path = str(tmp_path / "pending.jsonl")
+    queue = Job_Queue(handler, workers=1, persist_path=persist_path)
+    queue.start()
+    queue.submit(1, "running")
+    assert started.wait(5)
+    queue.submit(2, "waiting")
+
+    assert queue.shutdown(timeout=0.1) is False
+    release.set()
+
+    restarted = Job_Queue(lambda job_id, prompt: None, persist_path=persist_path)
+    assert sorted(job_id for job_id, _ in restarted._load_persisted()) == [1, 2]
+    assert ran == [1]
+
+
+def test_shutdown_returns_once_idle_workers_exit():
+    queue = Job_Queue(lambda job_id: None, workers=2)
+    queue.start()
+    threads = list(queue._threads)
+    assert queue.shutdown(timeout=5) is True
+    assert not any(thread.is_alive() for thread in threads)
@@ -0,0 +1,49 @@
+import os
+import time
+
+from PIL import Image
+
+from memedo.utils.output_store import Output_Store
+
+DIRECTORY = "memedo/out/creations"
+
+
+def write_render(name, color, mtime):
+    path = os.path.join(DIRECTORY, name)
+    Image.new("RGB", (16, 16), color).save(path)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_lru_eviction_calls_on_evict_with_the_removed_paths(tmp_path):
+    evicted = []
+    store = Output_Store(str(tmp_path), max_bytes=10, on_evict=evicted.extend)
+    for i, name in enumerate(("old.jpg", "new.jpg")):
+        (tmp_path / name).write_bytes(b"x" * 8)
+        os.utime(tmp_path / name, (1000 + i, 1000 + i))
+    store.add("new.jpg")
+    assert evicted == [os.path.join(str(tmp_path), "old.jpg")]
+    assert not (tmp_path / "old.jpg").exists()
+    assert store.stats()["evictions"] == 1
+
+
+def test_evicted_render_is_dropped_from_the_gallery(app_module, client):
+    os.makedirs(DIRECTORY, exist_ok=True)
+    old_path = write_render("evict-old.jpg", "red", 1000)
+    kept_path = write_render("evict-kept.jpg", "blue", 2000)
+    g = app_module.Generation(prompt="eviction", paths='[]', done=True, created_at=time.time() + 5000)
+    g.id = app_module.db.insert('gens', g).result()
+    for path in (old_path, kept_path):
+        app_module.save_image_result(g.id, {"template_id": 10, "path": path, "status": "ok"}).result()
+    # Render the card once, so it is in the card cache
+    assert old_path in client.get("/").text
+
+    store = Output_Store(DIRECTORY, max_bytes=os.path.getsize(kept_path), on_evict=app_module.mark_evicted)
+    store.add("evict-kept.jpg")
+
+    assert not os.path.exists(old_path)
+    page = client.get("/")
+    assert page.status_code == 200
+    assert old_path not in page.text and kept_path in page.text
+    items = {item["id"]: item for item in client.get("/api/gallery").json()["items"]}
+    assert items[g.id]["paths"] == [kept_path]
@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from benchmarks.bench_rotated_text import SAMPLE_TEXT, full_overlay_rotate, rotated_captions
+from memedo.utils.image_processor import Image_Manager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Share of caption pixels allowed to differ: nearest-neighbour sampling over the cropped
+# range rounds a few glyph-edge pixels differently
+TOLERANCE = 0.02
+
+
+@pytest.fixture(autouse=True)
+def fonts(monkeypatch):
+    # The font path is relative to the repository root
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.mark.parametrize("template_name, box", list(rotated_captions()),
+                         ids=lambda value: value if isinstance(value, str) else value.field)
+@pytest.mark.parametrize("size", [(1200, 1200), (700, 500)])
+def test_rotated_text_matches_the_full_overlay_rotation(template_name, box, size):
+    base = Image.new("RGBA", size, (128, 128, 128, 255))
+    expected = np.asarray(full_overlay_rotate(base, SAMPLE_TEXT, box.position, box.font_size, box.text_color,
+                                              box.wrapped_width, box.rotate_degrees), dtype=np.int16)
+    actual = np.asarray(Image_Manager.add_text(base, SAMPLE_TEXT, box.position, box.font_size,
+                                               text_color=box.text_color, wrapped_width=box.wrapped_width,
+                                               rotate_degrees=box.rotate_degrees), dtype=np.int16)
+    assert actual.shape == expected.shape
+    # A caption can rotate entirely off a small canvas; then both must be empty
+    text_pixels = max(1, int(((expected[..., 3] > 0) | (actual[..., 3] > 0)).sum()))
+    differing = int((np.abs(expected - actual).max(axis=-1) > 0).sum())
+    assert differing / text_pixels <= TOLERANCE
@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+import pytest
+
+from memedo.ai_agents import meme_agent, summary_agent
+from memedo.ai_agents.stub_server import SUMMARY, start_stub_server
+from memedo.models.template_registry import template_registry
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = start_stub_server()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(summary_agent, "url", f"{base_url}/chat/completions")
+    monkeypatch.setitem(meme_agent.client_options, "base_url", f"{base_url}/v1")
+    monkeypatch.setitem(meme_agent.client_options, "api_key", "stub")
+    monkeypatch.setattr(meme_agent, "client", None)
+    yield server
+    server.shutdown()
+
+
+def assert_renderable(memes):
+    assert len(memes["memes"]) == 3
+    for meme in memes["memes"]:
+        meme_text = json.loads(meme["meme_creation_input"])
+        assert set(template_registry.caption_fields(meme["id"])) <= set(meme_text)
+
+
+def test_sync_clients_against_the_stub(stub):
+    summary = summary_agent.get_match_summary("India vs Australia")
+    assert summary == SUMMARY
+    assert_renderable(meme_agent.generate_meme_content(summary, template_registry.catalogue(), num_memes=3))
+
+
+def test_async_clients_against_the_stub(stub):
+    async def generate():
+        try:
+            summary = await summary_agent.get_match_summary_async("India vs Australia")
+            memes = await meme_agent.generate_meme_content_async(summary, template_registry.catalogue(),
+                                                                 num_memes=3)
+        finally:
+            await summary_agent.aclose_async_client()
+            await meme_agent.aclose_async_client()
+        return summary, memes
+
+    summary, memes = asyncio.run(generate())
+    assert summary == SUMMARY
+    assert_renderable(memes)
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+
+import pytest
+
+from memedo.ai_agents import summary_agent
+from memedo.utils.summary_cache import Single_Flight, Summary_Cache, normalize_prompt
+
+
+@pytest.mark.parametrize("prompt", [
+    "India vs New Zealand, 17th Oct 2024",
+    "india vs new zealand 17 october, 2024",
+    "India vs New Zealand October 17th 2024",
+    "India vs New Zealand 2024-10-17",
+    "India vs New Zealand 2024/10/17",
+    "India vs New Zealand 17/10/2024",
+    "India vs New Zealand 17-10-2024",
+    "  INDIA   vs. New Zealand!! 17.10.2024 ",
+])
+def test_normalize_prompt_canonicalises_dates(prompt):
+    assert normalize_prompt(prompt) == "india vs new zealand 2024-10-17"
+
+
+def test_normalize_prompt_reads_numeric_dates_day_first():
+    assert normalize_prompt("5/11/2024") == "2024-11-05"
+    assert normalize_prompt("11/5/2024") == "2024-05-11"
+
+
+def test_normalize_prompt_leaves_impossible_dates_alone():
+    assert normalize_prompt("31/02/2024") == "31 02 2024"
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    flight = Single_Flight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "summary"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", fetch))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while flight.coalesced < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["summary"] * 4
+    assert len(calls) == 1
+    # The key is free again once the call is done
+    assert flight.do("key", lambda: "again") == "again"
+
+
+def test_single_flight_raises_the_leaders_error_for_every_caller():
+    flight = Single_Flight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", fetch)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while flight.coalesced < 2:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 3 and len({id(error) for error in errors}) == 1
+
+
+@pytest.fixture
+def raced_cache(monkeypatch, tmp_path):
+    """A cache holding the summary, whose first lookup misses as if the previous leader stored it just after."""
+    cache = Summary_Cache(str(tmp_path / "summaries.db"), ttl=60, max_entries=10)
+    cache.put(normalize_prompt("India vs Australia"), "India vs Australia", "cached summary")
+    lookups = []
+    get = cache.get
+
+    def first_lookup_misses(key, count=True):
+        lookups.append(key)
+        return None if len(lookups) == 1 else get(key, count)
+
+    monkeypatch.setattr(cache, "get", first_lookup_misses)
+    monkeypatch.setattr(summary_agent, "summary_cache", cache)
+    monkeypatch.setattr(summary_agent.config, "SUMMARY_CACHE_ENABLED", True)
+    return cache
+
+
+def test_single_flight_leader_rechecks_the_cache(monkeypatch, raced_cache):
+    monkeypatch.setattr(summary_agent, "get_match_summary", lambda event_desc: pytest.fail("called upstream"))
+    assert summary_agent.get_match_summary_cached("India vs Australia") == "cached summary"
+
+
+def test_async_single_flight_leader_rechecks_the_cache(monkeypatch, raced_cache):
+    async def upstream(event_desc):
+        pytest.fail("called upstream")
+
+    monkeypatch.setattr(summary_agent, "get_match_summary_async", upstream)
+    assert asyncio.run(summary_agent.get_match_summary_cached_async("India vs Australia")) == "cached summary"